@@ -1,24 +1,52 @@
-__all__ = ["Bases", "HumanPlayer", "QLearningAgent", "RandomAgent",
-           "train_agents", "evaluate_hyperparameters", "hyperparameter_tuning"]
+__all__ = ["Bases", "BatchBases", "HumanPlayer", "QLearningAgent",
+           "RandomAgent", "GreedyAgent", "LinearQAgent", "SearchAgent",
+           "MCTSAgent", "EndgameAgent", "SolvedAgent", "RemoteAgent",
+           "train_agents", "train_offline", "evaluate_hyperparameters",
+           "evaluate_batch", "hyperparameter_tuning", "measure_throughput",
+           "tournament"]
 
-from .game import Bases
-from .player import HumanPlayer
-from .agent import QLearningAgent
-from .agent import RandomAgent
-from .train import train_agents
-from .train import evaluate_hyperparameters
-from .train import hyperparameter_tuning
-import yaml
-from pathlib import Path
+import importlib
+from .config import Config
 
-yaml_file = 'bases.yml'
-with open(yaml_file, 'r') as f:
-    cfg = yaml.safe_load(f)
-POLICY_PATH = cfg['policy_path']
-LINES_LOG_PATH = cfg['lines_log']
+# Submodules are imported on first use of a name, so `import bases` stays
+# cheap and does not pull in NumPy
+_EXPORTS = {
+    'Bases': 'game',
+    'BatchBases': 'batch',
+    'HumanPlayer': 'player',
+    'QLearningAgent': 'agent',
+    'RandomAgent': 'agent',
+    'GreedyAgent': 'agent',
+    'LinearQAgent': 'linear',
+    'SearchAgent': 'search',
+    'MCTSAgent': 'mcts',
+    'EndgameAgent': 'endgame',
+    'SolvedAgent': 'solver',
+    'RemoteAgent': 'serve',
+    'train_agents': 'train',
+    'evaluate_hyperparameters': 'train',
+    'evaluate_batch': 'train',
+    'hyperparameter_tuning': 'train',
+    'measure_throughput': 'train',
+    'train_offline': 'offline',
+    'tournament': 'arena',
+}
+# Shortcuts to settings
+_SETTINGS = {'POLICY_PATH': 'policy_path', 'LINES_LOG_PATH': 'lines_log'}
 
-Path(cfg['policy_path']).parent.mkdir(parents=True, exist_ok=True)
-Path(cfg['lines_log']).parent.mkdir(parents=True, exist_ok=True)
-Path(cfg['game_log']).parent.mkdir(parents=True, exist_ok=True)
-Path(cfg['hyperparameter_tuning_results']).parent.mkdir(
-    parents=True, exist_ok=True)
+cfg = Config()
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module(f'.{_EXPORTS[name]}', __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _SETTINGS:
+        return cfg[_SETTINGS[name]]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS) + list(_SETTINGS))
@@ -1,17 +1,80 @@
 
 import bases
+import itertools
 import random
 import json
+import numpy as np
+from array import array
+from .batch import random_legal_actions, tactical_ties
+from .board import board_tables, symmetry_tables
+from .config import ensure_parent
+from .endgame import endgame_move, is_endgame, solve_endgame
+
+# Box owner codes packed two bits per box above the edge bits of a state key
+OWNER_CODES = {None: 0, ' ': 0, 'A': 1, 'B': 2}
+OWNERS = (None, 'A', 'B')
+# Which states `QLearningAgent.evict` drops first
+EVICTION_POLICIES = ('lru', 'lfu', 'magnitude')
+# Share of `max_states` left after an eviction, so evictions are rare
+EVICT_TO = 0.9
 
 
 class RandomAgent:
     def choose_action(self, game):
         return random.choice(game.available_moves())
 
+    def choose_actions(self, batch) -> np.ndarray:
+        """One random legal edge id per game of a `BatchBases`."""
+        return random_legal_actions(batch.legal_moves())
+
+
+class GreedyAgent:
+    """
+    Baseline that completes a box whenever it can, else plays a move
+    that gives nothing away, else the one that gives away the fewest
+    boxes; ties are broken at random.
+    """
+
+    def choose_action(self, game):
+        analysis = game.analyze_moves()
+        best = max((completes, -gives_away)
+                   for _, completes, gives_away in analysis)
+        return random.choice([move for move, completes, gives_away
+                              in analysis
+                              if (completes, -gives_away) == best])
+
+    def choose_actions(self, batch) -> np.ndarray:
+        """The same choice for every game of a `BatchBases`."""
+        completes, gives_away = batch.analyze_moves()
+        scores = np.where(batch.legal_moves(),
+                          completes * 8 - gives_away, -np.inf)
+        return random_legal_actions(
+            scores == scores.max(axis=1, keepdims=True))
+
 
 class QLearningAgent:
+    """
+    Tabular Q-learning agent.
+
+    `q_table` maps an integer state key (edge bitmask plus packed box
+    owners, see `Bases.get_state_key`) in canonical symmetric form to an
+    array of float32 Q-values indexed by edge id in the canonical frame.
+
+    With `max_states`, or `adaptive_learning_rate`, the updates of each
+    state are counted in `state_visits`, whose order is that of the last
+    update. Once the table outgrows `max_states`, `evict` drops states
+    down to 90% of it: the least recently updated ('lru'), least often
+    updated ('lfu') or those with the smallest Q-values ('magnitude').
+    An adaptive learning rate is 1/visits of the state, but not below
+    `learning_rate`.
+    """
+
     def __init__(self, grid_size: int, learning_rate=0.01, discount_factor=0.5,
-                 exploration_rate=0.01, training_mode=True):
+                 exploration_rate=0.01, training_mode=True,
+                 endgame_solver=False, trace_decay=None,
+                 max_states: int | None = None, eviction: str = 'lru',
+                 adaptive_learning_rate: bool = False,
+                 tactical_tie_break: bool = True):
         self.q_table = {}
         if training_mode is False:
             self.learning_rate = bases.cfg['learning_rate']
@@ -23,42 +86,358 @@ class QLearningAgent:
             self.exploration_rate = exploration_rate
 
         self.grid_size = grid_size
+        self.tables = board_tables(grid_size)
+        self.symmetry = symmetry_tables(grid_size)
+        self._perm_arrays = [np.array(perm)
+                             for perm in self.symmetry.edge_perms]
         self.training_mode = training_mode
+        # Play chain/loop endgames exactly (bases.endgame) and only learn
+        # the positions before them
+        self.endgame_solver = endgame_solver
+        # Optional {(state, edge): update count}, enabled by assigning a dict
+        self.visits = None
+        # Lambda of episode-level lambda-return updates (see
+        # `finish_episode`); None updates after every move instead
+        self.trace_decay = trace_decay
+        self.trajectory = []
+        self._last_canonical = (None, None)
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction}'")
+        self.max_states = max_states
+        self.eviction = eviction
+        self.adaptive_learning_rate = adaptive_learning_rate
+        # {state: update count}, least recently updated first
+        self.state_visits = {} if max_states or adaptive_learning_rate \
+            else None
+        # Break ties between best (or unknown) moves by `enhance_reward`
+        self.tactical_tie_break = tactical_tie_break
 
     def choose_action(self, game) -> list:
+        if self.endgame_solver:
+            move = endgame_move(game)
+            if move is not None:
+                return move
         available_moves = game.available_moves()
-        state = self.symmetrical_states(game.get_detailed_state())
 
         # Exploration is only allowed in training mode
         if self.training_mode and random.random() < self.exploration_rate:
             return random.choice(available_moves)
 
         # Exploitation: always select the best-known action based on Q-values
-        q_values = [(move, self.q_table.get((state, move), 0))
-                    for move in available_moves]
-        max_q = max(q_values, key=lambda item: item[1])[1]
-        best_actions = [move for move, q in q_values if q == max_q]
+        state, perm = self.canonical_state(game.get_state_key())
+        values = self.q_table.get(state)
+        if values is None:
+            best_actions = available_moves
+        else:
+            edge_index = self.tables.edge_index
+            q_values = [(move, values[perm[edge_index[move]]])
+                        for move in available_moves]
+            max_q = max(q_values, key=lambda item: item[1])[1]
+            best_actions = [move for move, q in q_values if q == max_q]
 
+        if self.tactical_tie_break and len(best_actions) > 1:
+            rewards = self.tactical_rewards(game)
+            top = max(rewards[move] for move in best_actions)
+            best_actions = [move for move in best_actions
+                            if rewards[move] == top]
         return random.choice(best_actions)
 
+    def tactical_rewards(self, game) -> dict:
+        """`enhance_reward` of every available move, from one
+        `Bases.analyze_moves` pass."""
+        return {move: self.enhance_reward(completes, gives_away)
+                for move, completes, gives_away in game.analyze_moves()}
+
+    def choose_actions(self, batch) -> np.ndarray:
+        """
+        Epsilon-greedy edge ids for every game of a `BatchBases`.
+        Q-values are gathered into one (N, num_edges) matrix; ties between
+        best moves are broken as in `choose_action`.
+        """
+        legal = batch.legal_moves()
+        q_values = self.q_matrix([batch.get_state_key(game)
+                                  for game in range(batch.num_games)])
+        q_values[~legal] = -np.inf
+
+        best = q_values == q_values.max(axis=1, keepdims=True)
+        if self.tactical_tie_break:
+            best = tactical_ties(best, *batch.analyze_moves())
+        actions = random_legal_actions(best)
+        if self.training_mode:
+            explore = np.random.random(batch.num_games) < \
+                self.exploration_rate
+            actions[explore] = random_legal_actions(legal[explore])
+        if self.endgame_solver:
+            for game in range(batch.num_games):
+                solution = solve_endgame(
+                    self.grid_size,
+                    batch.get_state_key(game) & self.tables.full_mask)
+                if solution is not None:
+                    actions[game] = solution[1]
+        return actions
+
+    def q_matrix(self, keys) -> np.ndarray:
+        """
+        (len(keys), num_edges) Q-values of integer state keys, indexed by
+        board edge id; rows of unseen states are zero.
+        """
+        q_values = np.zeros((len(keys), self.tables.num_edges),
+                            dtype=np.float32)
+        perms = self._perm_arrays
+        for row, key in enumerate(keys):
+            state, sym = self.symmetry.canonical(key)
+            values = self.q_table.get(state)
+            if values is not None:
+                # Row is in the canonical frame; index it by board edge
+                q_values[row] = np.frombuffer(values,
+                                              dtype=np.float32)[perms[sym]]
+        return q_values
+
     def update(self, previous_state, action,
                reward, next_state, available_moves) -> None:
-        previous_state = self.symmetrical_states(previous_state)
-        next_state = self.symmetrical_states(next_state)
+        """
+        States may be integer state keys or `get_detailed_state` tuples;
+        `action` and `available_moves` are line tuples.
+        """
+        previous_state, previous_perm = self.canonical_state(previous_state)
+        edge_index = self.tables.edge_index
+        if self.trace_decay is not None:
+            # Learned in one backward pass by `finish_episode`
+            if not (self.endgame_solver and is_endgame(
+                    self.grid_size, previous_state & self.tables.full_mask)):
+                self.trajectory.append((previous_state,
+                                        previous_perm[edge_index[action]],
+                                        reward))
+            return
+        next_state, next_perm = self.canonical_state(next_state)
+        self._learn(previous_state, previous_perm[edge_index[action]],
+                    reward, next_state,
+                    (next_perm[edge_index[move]] for move in available_moves))
+
+    def finish_episode(self, reward: float = 0) -> None:
+        """
+        Learn the recorded trajectory of the game just played, with
+        `reward` (the result for this agent) added to its last move.
+
+        Working backwards, each move is moved towards its lambda-return
+        G_t = r_t + discount * ((1 - lambda) * max Q(s_t+1) +
+        lambda * G_t+1), where s_t+1 is the agent's next decision state,
+        so the result reaches every move of the episode at once. Boxes
+        the opponent claims before s_t+1 are charged to r_t. Each state
+        on the trajectory is canonicalized once, when recorded. Does
+        nothing when updating after every move.
+        """
+        trajectory, self.trajectory = self.trajectory, []
+        if not trajectory:
+            return
+        tables = self.tables
+        trace_decay = self.trace_decay
+        num_edges = tables.num_edges
+        # Low bit of each box's 2-bit owner field
+        owner_mask = sum(1 << 2 * box for box in range(tables.num_boxes))
+
+        def claimed(key):
+            owners = key >> num_edges
+            return ((owners | owners >> 1) & owner_mask).bit_count()
+
+        target = reward
+        next_state, next_claimed = None, tables.num_boxes
+        for state, edge, move_reward in reversed(trajectory):
+            taken = claimed(state) + \
+                tables.completed_boxes(state & tables.full_mask, edge)
+            move_reward -= next_claimed - taken
+            if next_state is None:
+                target += move_reward
+            else:
+                next_values = self.q_table.get(next_state)
+                best_next = 0 if next_values is None else \
+                    max((next_values[free_edge]
+                         for free_edge in range(num_edges)
+                         if not next_state >> free_edge & 1), default=0)
+                target = move_reward + self.discount_factor * (
+                    (1 - trace_decay) * best_next + trace_decay * target)
+
+            values = self.q_table.get(state)
+            if values is None:
+                values = self.new_row()
+            values[edge] += self._rate(state) * (target - values[edge])
+            self._store(state, values)
+            if self.visits is not None:
+                key = (state, edge)
+                self.visits[key] = self.visits.get(key, 0) + 1
+            next_state, next_claimed = state, claimed(state)
+
+    def update_batch(self, transitions) -> None:
+        """
+        `update` over (state, edge, reward, next_state) transitions with
+        integer state keys and board edge ids, applied in order. Each
+        distinct state is canonicalized once per batch and the moves left
+        after a transition are read from the next state's drawn edges.
+        """
+        canonical, free_edges = {}, {}
+        canonicalize = self.symmetry.canonical
+        edge_perms = self.symmetry.edge_perms
+        num_edges = self.tables.num_edges
+        for state, edge, reward, next_state in transitions:
+            for key in (state, next_state):
+                if key not in canonical:
+                    canonical[key] = canonicalize(key)
+            state, sym = canonical[state]
+            next_state = canonical[next_state][0]
+            free = free_edges.get(next_state)
+            if free is None:
+                free = free_edges[next_state] = \
+                    [free_edge for free_edge in range(num_edges)
+                     if not next_state >> free_edge & 1]
+            self._learn(state, edge_perms[sym][edge], reward, next_state,
+                        free)
+
+    def _learn(self, previous_state: int, edge: int, reward: float,
+               next_state: int, next_edges) -> None:
+        """Bellman update of canonical `previous_state` and `edge`;
+        `next_edges` are the canonical ids of the moves left."""
+        full_mask = self.tables.full_mask
+
+        endgame = None
+        if self.endgame_solver:
+            if is_endgame(self.grid_size, previous_state & full_mask):
+                return  # played by the solver, nothing to learn
+            endgame = solve_endgame(self.grid_size, next_state & full_mask)
 
-        old_value = self.q_table.get((previous_state, action), 0)
         # Future rewards based on next state and available actions
-        future_rewards = max((self.q_table.get((next_state, move), 0)
-                              for move in available_moves), default=0)
+        next_values = self.q_table.get(next_state)
+        if endgame is not None:
+            # Exact boxes this agent still takes once the opponent, who
+            # moves next, plays the endgame optimally
+            margin, _, boxes_left = endgame
+            future_rewards = (boxes_left - margin) / 2
+        elif next_values is None:
+            future_rewards = 0
+        else:
+            future_rewards = max((next_values[next_edge]
+                                  for next_edge in next_edges), default=0)
+
+        values = self.q_table.get(previous_state)
+        if values is None:
+            values = self.new_row()
 
         # Update the Q-value using Bellman
-        updated_value = (1 - self.learning_rate) * \
-            old_value + self.learning_rate * \
+        learning_rate = self._rate(previous_state)
+        values[edge] = (1 - learning_rate) * \
+            values[edge] + learning_rate * \
             (reward + self.discount_factor * future_rewards)
+        # Rows read from a mapped policy are copies; store them back
+        self._store(previous_state, values)
+
+        if self.visits is not None:
+            key = (previous_state, edge)
+            self.visits[key] = self.visits.get(key, 0) + 1
+
+    def _rate(self, state: int) -> float:
+        """Learning rate of the next update of `state`."""
+        if not self.adaptive_learning_rate:
+            return self.learning_rate
+        return max(self.learning_rate,
+                   1 / (self.state_visits.get(state, 0) + 1))
+
+    def _store(self, state: int, values: array) -> None:
+        """Write back an updated row, counting the visit and evicting
+        states past `max_states`."""
+        self.q_table[state] = values
+        state_visits = self.state_visits
+        if state_visits is None:
+            return
+        # Re-inserted so the dict stays ordered by last update
+        state_visits[state] = state_visits.pop(state, 0) + 1
+        if self.max_states and len(self.q_table) > self.max_states:
+            self.evict(protect=state)
+
+    def evict(self, keep: int | None = None, protect: int | None = None) \
+            -> int:
+        """
+        Drop states down to `keep` (90% of `max_states` by default) by the
+        `eviction` policy; states never updated by this agent (e.g. read
+        from a policy file) go first under 'lru'. Candidates are ordered
+        by key, then by last update, not by table order, so a table
+        restored from a checkpoint evicts the same states. `protect` (the
+        state just stored) is never dropped. Returns the number dropped.
+        """
+        if keep is None:
+            keep = int(self.max_states * EVICT_TO)
+        excess = len(self.q_table) - keep
+        if excess <= 0:
+            return 0
+        self._materialize()
+        state_visits = self.state_visits or {}
+        unvisited = sorted(state for state in self.q_table
+                           if state not in state_visits and state != protect)
+        if self.eviction == 'lru':
+            victims = unvisited[:excess]
+            if len(victims) < excess:
+                victims.extend(itertools.islice(
+                    (state for state in state_visits if state != protect),
+                    excess - len(victims)))
+        else:
+            states = unvisited + [state for state in state_visits
+                                  if state in self.q_table
+                                  and state != protect]
+            excess = min(excess, len(states))
+            if self.eviction == 'lfu':
+                scores = np.fromiter((state_visits.get(state, 0)
+                                      for state in states),
+                                     dtype=np.int64, count=len(states))
+            else:
+                scores = np.fromiter(
+                    (max(map(abs, self.q_table[state])) for state in states),
+                    dtype=np.float32, count=len(states))
+            lowest = np.argpartition(scores, excess - 1)[:excess]
+            victims = [states[index] for index in lowest.tolist()]
+        for state in victims:
+            self.q_table.pop(state, None)
+            state_visits.pop(state, None)
+        return len(victims)
+
+    def prune(self, min_magnitude: float = 0.0) -> int:
+        """
+        Drop states whose Q-values all have a magnitude of at most
+        `min_magnitude`. All-zero rows play like missing ones, so the
+        default loses nothing. Returns the number dropped.
+        """
+        self._materialize()
+        victims = [state for state, values in self.q_table.items()
+                   if max(map(abs, values), default=0) <= min_magnitude]
+        for state in victims:
+            del self.q_table[state]
+            if self.state_visits is not None:
+                self.state_visits.pop(state, None)
+        return len(victims)
+
+    def _materialize(self) -> None:
+        """Replace a memory-mapped policy by a dict, so rows can be
+        deleted."""
+        if not isinstance(self.q_table, dict):
+            q_table = self.q_table
+            self.q_table = dict(q_table.items())
+            q_table.close()
+
+    def new_row(self) -> array:
+        """Zeroed per-action Q-values for one state."""
+        return array('f', bytes(4 * self.tables.num_edges))
+
+    def get_q(self, state: int, edge: int) -> float:
+        values = self.q_table.get(state)
+        return 0.0 if values is None else values[edge]
 
-        self.q_table[(previous_state, action)] = updated_value
+    def set_q(self, state: int, edge: int, value: float) -> None:
+        values = self.q_table.get(state)
+        if values is None:
+            values = self.new_row()
+        values[edge] = value
+        self._store(state, values)
 
     def enhance_reward(self, completed_box, potential_box_opponent) -> float:
+        """Shaped reward of a move that completes `completed_box` boxes
+        and gives away `potential_box_opponent` (counts or flags)."""
         reward = 0
         if completed_box:
             reward += 1
@@ -67,44 +446,92 @@ class QLearningAgent:
         return reward
 
     def save_policy(self, file_path) -> None:
-        serialized_q_table = {str(k): v for k, v in self.q_table.items()}
-        with open(file_path, 'w') as f:
-            json.dump(serialized_q_table, f)
+        """Binary policy (see `bases.policy`) unless the path is .json"""
+        from .policy import write_policy
+
+        ensure_parent(file_path)
+        if str(file_path).endswith('.json'):
+            serialized_q_table = {str(k): list(v)
+                                  for k, v in self.q_table.items()}
+            with open(file_path, 'w') as f:
+                json.dump(serialized_q_table, f)
+        else:
+            write_policy(file_path, self.q_table, self.grid_size,
+                         self.learning_rate, self.discount_factor,
+                         self.exploration_rate)
 
     def load_policy(self, file_path) -> None:
+        """Memory-map a binary policy, or read a {state: [q-values]} JSON
+        policy."""
+        from .policy import MappedQTable, is_binary_policy
+
         try:
-            with open(file_path, 'r') as f:
-                serialized_q_table = json.load(f)
+            binary = is_binary_policy(file_path)
         except FileNotFoundError:
             print("************************************************")
             print(f" FileNotFoundError: Cannot find the {file_path}\n",
                   "Please train the AI agent first and try again.")
             print("************************************************")
             quit()
+        if binary:
+            q_table = MappedQTable(file_path)
+            if q_table.grid_size != self.grid_size:
+                raise ValueError(f"{file_path} holds a policy for grid size "
+                                 f"{q_table.grid_size}, not {self.grid_size}")
+            self.q_table = q_table
         else:
-            self.q_table = {eval(k): v for k, v in serialized_q_table.items()}
+            with open(file_path, 'r') as f:
+                serialized_q_table = json.load(f)
+            self.q_table = {int(k): array('f', v)
+                            for k, v in serialized_q_table.items()}
 
-    def symmetrical_states(self, state):
+    def state_key(self, state) -> int:
+        """Integer key of a (lines, boxes) state; ints pass through."""
+        if isinstance(state, int):
+            return state
         lines, boxes = state
-        transformed_states = self.generate_rotations_and_reflections(lines,
-                                                                     boxes)
-
-        # Normalize each state by sorting the lines
-        # and making boxes hashable and comparable
-        normalized_states = []
-        for trans_lines, trans_boxes in transformed_states:
-            norm_lines = tuple(sorted(tuple(sorted(line_pair))
-                                      for line_pair in trans_lines))
-            # Replace None with ' ' in boxes to avoid comparison issues
-            norm_boxes = tuple(
-                tuple(cell if cell is not None else ' ' for cell in row)
-                for row in trans_boxes
-            )
-            normalized_states.append((norm_lines, norm_boxes))
-
-        # Return the canonical form: the lexicographically smallest
-        canonical_state = min(normalized_states)
-        return canonical_state
+        edge_index = self.tables.edge_index
+        key = 0
+        for line in lines:
+            key |= 1 << edge_index[line]
+        shift = self.tables.num_edges
+        for row in boxes:
+            for cell in row:
+                key |= OWNER_CODES[cell] << shift
+                shift += 2
+        return key
+
+    def decode_state(self, key: int) -> tuple[list, list[list]]:
+        """Inverse of `state_key`: (lines, boxes) of an integer key."""
+        size = self.grid_size
+        num_edges = self.tables.num_edges
+        lines = [line for edge, line in enumerate(self.tables.edges)
+                 if key >> edge & 1]
+        boxes = [[OWNERS[key >> (num_edges + 2 * (row * size + col)) & 3]
+                  for col in range(size)] for row in range(size)]
+        return lines, boxes
+
+    def symmetrical_states(self, state) -> int:
+        """
+        Canonical form of a state: the smallest integer key over all
+        rotations and reflections of the board.
+        """
+        return self.symmetry.canonical(self.state_key(state))[0]
+
+    def canonical_state(self, state) -> tuple[int, tuple]:
+        """
+        Canonical key of a state and the edge permutation that maps moves
+        on the board into the canonical frame. Q-value rows are stored in
+        that frame, so symmetric positions share their move values.
+        """
+        state = self.state_key(state)
+        # The state just chosen from is usually the one updated next
+        if self._last_canonical[0] == state:
+            return self._last_canonical[1]
+        key, sym = self.symmetry.canonical(state)
+        result = key, self.symmetry.edge_perms[sym]
+        self._last_canonical = (state, result)
+        return result
 
     def generate_rotations_and_reflections(self, lines, boxes) -> list:
         transformations = []
@@ -116,7 +543,7 @@ class QLearningAgent:
             rotated_lines = []
             for x1, y1, x2, y2 in lines:
                 rotated_lines.append((y1, size - x1, y2, size - x2))
-            rotated_boxes = [[boxes[size - j - 1][i]
+            rotated_boxes = [[boxes[j][size - i - 1]
                               for j in range(size)] for i in range(size)]
             return rotated_lines, rotated_boxes
 
@@ -124,7 +551,7 @@ class QLearningAgent:
             reflected_lines = []
             for x1, y1, x2, y2 in lines:
                 reflected_lines.append((x1, size - y1, x2, size - y2))
-            reflected_boxes = [row[::-1] for row in boxes]
+            reflected_boxes = boxes[::-1]
             return reflected_lines, reflected_boxes
 
         # Add rotations (90°, 180°, 270°)
@@ -0,0 +1,299 @@
+"""
+Matches between agents, stopped early once the result is settled.
+
+    python -m bases.arena 3 random endgame q=data/policy/policy.bin
+    python -m bases.arena 3 q=data/policy/policy.bin random mcts:500 \\
+        --gauntlet q --workers 4
+
+Games are played in pairs with the seats swapped, so neither agent
+profits from moving first. After every batch of pairs a sequential
+probability ratio test (SPRT) decides between "the first agent is
+`elo` stronger" and "the second agent is `elo` stronger"; a pairing
+stops as soon as one is accepted, or after `max_games`.
+"""
+import functools
+import itertools
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from .game import Bases
+
+# Score of the agent in seat A per result
+SCORES = {'A': 1.0, 'B': 0.0, 'Tie': 0.5}
+# Variance floor of a pair score, so unanimous results stay finite
+MIN_VARIANCE = 1e-3
+
+_players = {}
+
+
+def make_agent(spec: str, grid_size: int):
+    """
+    Agent from a command-line spec: 'random', 'greedy', 'endgame',
+    'mcts[:playouts]', 'search[:seconds]', 'solved:<table>',
+    'linear:<weights>', or the path of a Q-policy.
+    """
+    from .agent import GreedyAgent, QLearningAgent, RandomAgent
+
+    kind, _, argument = spec.partition(':')
+    if kind == 'random':
+        return RandomAgent()
+    if kind == 'greedy':
+        return GreedyAgent()
+    if kind == 'endgame':
+        from .endgame import EndgameAgent
+        return EndgameAgent()
+    if kind == 'mcts':
+        from .mcts import MCTSAgent
+        return MCTSAgent(int(argument or 2000))
+    if kind == 'search':
+        from .search import SearchAgent
+        return SearchAgent(float(argument or 0.1))
+    if kind == 'linear':
+        from .linear import LinearQAgent
+        agent = LinearQAgent(grid_size, training_mode=False)
+        agent.load_policy(argument)
+        return agent
+    if kind == 'solved':
+        from .solver import SolvedAgent
+        return SolvedAgent(argument)
+    agent = QLearningAgent(grid_size, training_mode=False)
+    agent.load_policy(spec)
+    return agent
+
+
+def elo_from_score(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_from_elo(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+class Pairing:
+    """
+    Results of `first` against `second`. `pair_scores` holds the mean
+    score of `first` over each pair of games (one in each seat), the unit
+    the statistics are computed on.
+    """
+
+    def __init__(self, first: str, second: str):
+        self.first = first
+        self.second = second
+        self.results = {'win': 0, 'loss': 0, 'tie': 0}
+        self.pair_scores = []
+        self.winner = None
+        self.decided = False
+
+    @property
+    def games(self) -> int:
+        return 2 * len(self.pair_scores)
+
+    def add(self, games: list[tuple[float, float]]) -> None:
+        """Record pairs of (score as A, score as B) of `first`."""
+        for pair in games:
+            for score in pair:
+                self.results['win' if score == 1 else
+                             'loss' if score == 0 else 'tie'] += 1
+            self.pair_scores.append(sum(pair) / 2)
+
+    def _moments(self) -> tuple[int, float, float]:
+        pairs = len(self.pair_scores)
+        mean = sum(self.pair_scores) / max(pairs, 1)
+        variance = sum((score - mean) ** 2 for score in self.pair_scores) / \
+            max(pairs - 1, 1)
+        return pairs, mean, max(variance, MIN_VARIANCE)
+
+    def score(self) -> float:
+        return self._moments()[1]
+
+    def elo(self) -> float:
+        return elo_from_score(self.score())
+
+    def elo_interval(self, z: float = 1.96) -> tuple[float, float]:
+        """Confidence interval of the Elo difference (95% by default)."""
+        pairs, mean, variance = self._moments()
+        margin = z * math.sqrt(variance / max(pairs, 1))
+        return elo_from_score(mean - margin), elo_from_score(mean + margin)
+
+    def llr(self, elo0: float, elo1: float) -> float:
+        """Log-likelihood ratio of Elo difference `elo1` over `elo0`, with
+        pair scores taken as normally distributed."""
+        pairs, mean, variance = self._moments()
+        score0, score1 = score_from_elo(elo0), score_from_elo(elo1)
+        return pairs * (score1 - score0) * (2 * mean - score0 - score1) / \
+            (2 * variance)
+
+    def summary(self) -> str:
+        low, high = self.elo_interval()
+        verdict = 'inconclusive' if self.winner is None else \
+            f'{self.winner} stronger'
+        return (f"{self.first} vs {self.second}: {self.games} games, "
+                f"+{self.results['win']} -{self.results['loss']} "
+                f"={self.results['tie']}, score {self.score():.1%}, "
+                f"Elo {self.elo():+.0f} [{low:+.0f}, {high:+.0f}], "
+                f"{verdict}")
+
+
+def _init_worker(players: dict) -> None:
+    """Build the agents of a worker; factories are called here."""
+    _players.clear()
+    for name, player in players.items():
+        _players[name] = player if hasattr(player, 'choose_action') \
+            else player()
+
+
+def _play(game: Bases, player_a, player_b) -> str:
+    """Play one game without learning; returns the result."""
+    game.reset()
+    players = {'A': player_a, 'B': player_b}
+    edge_index = game.tables.edge_index
+    while not game.is_full():
+        edge = edge_index.get(players[game.turn].choose_action(game))
+        if edge is None or game.drawn >> edge & 1:
+            continue
+        game.draw_edge(edge)
+        game.turn = 'B' if game.turn == 'A' else 'A'
+    return game.get_winner()
+
+
+def _play_pairs(grid_size: int, first: str, second: str, pairs: int,
+                seed: int | None) -> list[tuple[float, float]]:
+    """(score as A, score as B) of `first` for `pairs` pairs of games."""
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed % 2**32)
+    game = Bases(grid_size)
+    player, opponent = _players[first], _players[second]
+    return [(SCORES[_play(game, player, opponent)],
+             1 - SCORES[_play(game, opponent, player)])
+            for _ in range(pairs)]
+
+
+def tournament(players: dict, grid_size: int, gauntlet: str | None = None,
+               workers: int = 1, max_games: int = 2000, batch_pairs: int = 8,
+               elo: float = 25, alpha: float = 0.05, beta: float = 0.05,
+               seed: int | None = None) -> list[Pairing]:
+    """
+    Round robin between `players` ({name: agent or factory}), or with
+    `gauntlet` only that player against each other one.
+
+    Each pairing plays batches of `batch_pairs` game pairs until the
+    SPRT of Elo +`elo` against -`elo` for the first player accepts one
+    (with error rates `alpha` and `beta`) or `max_games` are played.
+    Batches run on a pool of `workers` processes, which get a copy of
+    every agent; a factory (e.g. a `functools.partial` of `make_agent`)
+    is called in each worker instead, for agents that cannot be pickled.
+    Agents play as given, so set `training_mode=False` on Q-agents.
+    """
+    names = list(players)
+    if gauntlet is not None:
+        if gauntlet not in players:
+            raise ValueError(f"Unknown gauntlet player '{gauntlet}'")
+        matchups = [(gauntlet, name) for name in names if name != gauntlet]
+    else:
+        matchups = list(itertools.combinations(names, 2))
+    pairings = [Pairing(*matchup) for matchup in matchups]
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    max_pairs = max(1, max_games // 2)
+    submitted = [0] * len(pairings)
+    batches = itertools.count()
+
+    def next_job():
+        open_pairings = [index for index, pairing in enumerate(pairings)
+                         if not pairing.decided and
+                         submitted[index] < max_pairs]
+        if not open_pairings:
+            return None
+        index = min(open_pairings, key=lambda index: submitted[index])
+        pairs = min(batch_pairs, max_pairs - submitted[index])
+        submitted[index] += pairs
+        batch = next(batches)
+        job_seed = None if seed is None else hash((seed, index, batch))
+        pairing = pairings[index]
+        return index, (grid_size, pairing.first, pairing.second, pairs,
+                       job_seed)
+
+    def record(index, games):
+        pairing = pairings[index]
+        if pairing.decided:
+            return
+        pairing.add(games)
+        llr = pairing.llr(-elo, elo)
+        if llr >= upper or llr <= lower:
+            pairing.decided = True
+            pairing.winner = pairing.first if llr >= upper \
+                else pairing.second
+        elif pairing.games >= 2 * max_pairs:
+            pairing.decided = True
+        if pairing.decided:
+            print(pairing.summary())
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(players,)) as pool:
+            running = {}
+            while True:
+                while len(running) < 2 * workers:
+                    job = next_job()
+                    if job is None:
+                        break
+                    index, args = job
+                    running[pool.submit(_play_pairs, *args)] = index
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(running.pop(future), future.result())
+    else:
+        _init_worker(players)
+        while (job := next_job()) is not None:
+            index, args = job
+            record(index, _play_pairs(*args))
+    return pairings
+
+
+def standings(pairings: list[Pairing]) -> list[tuple[str, float, int]]:
+    """(name, mean score, games) per player, best first."""
+    totals = {}
+    for pairing in pairings:
+        for name, score in ((pairing.first, pairing.score()),
+                            (pairing.second, 1 - pairing.score())):
+            points, games = totals.get(name, (0.0, 0))
+            totals[name] = (points + score * pairing.games,
+                            games + pairing.games)
+    table = [(name, points / max(games, 1), games)
+             for name, (points, games) in totals.items()]
+    return sorted(table, key=lambda row: -row[1])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Play a round robin or gauntlet between agents.")
+    parser.add_argument('grid_size', type=int, help="boxes per side")
+    parser.add_argument('players', nargs='+',
+                        help="[name=]spec, see bases.arena.make_agent")
+    parser.add_argument('--gauntlet', help="name of the player to test")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-games', type=int, default=2000)
+    parser.add_argument('--batch-pairs', type=int, default=8)
+    parser.add_argument('--elo', type=float, default=25,
+                        help="Elo difference the SPRT decides on")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    specs = {}
+    for player in args.players:
+        name, _, spec = player.rpartition('=')
+        specs[name or spec] = functools.partial(make_agent, spec,
+                                                args.grid_size)
+    results = tournament(specs, args.grid_size, args.gauntlet, args.workers,
+                         args.max_games, args.batch_pairs, args.elo,
+                         seed=args.seed)
+    print("\n----- Standings -----")
+    for name, score, games in standings(results):
+        print(f"{name:<20} {score:>7.1%} {elo_from_score(score):>+7.0f} Elo",
+              f"({games} games)")
@@ -0,0 +1,158 @@
+import numpy as np
+from .board import board_tables
+
+OWNERS = (None, 'A', 'B')
+RESULTS = ('A', 'B', 'Tie')
+
+
+class BatchBases:
+    """
+    N independent Bases games advanced in lockstep with NumPy.
+
+    Per-game state lives in arrays indexed by game:
+      - edges:  (N, num_edges) bool, drawn edge ids
+      - sides:  (N, num_boxes) drawn sides per box
+      - owners: (N, num_boxes) 0 = nobody, 1 = A, 2 = B
+      - scores: (N, 2) boxes owned by A and B
+      - turn:   (N,) 0 = A, 1 = B
+    Moves are edge ids (see `bases.board.BoardTables`). As in `Bases`, the
+    turn alternates after every move, so all games in a batch finish on
+    the same ply.
+    """
+
+    def __init__(self, size: int, num_games: int):
+        self.size = size
+        self.num_games = num_games
+        self.tables = board_tables(size)
+        num_boxes = self.tables.num_boxes
+
+        self.edge_boxes = padded_edge_boxes(self.tables)
+        self.rows = np.arange(num_games)[:, None]
+
+        self.edges = np.zeros((num_games, self.tables.num_edges), dtype=bool)
+        self.sides = np.zeros((num_games, num_boxes + 1), dtype=np.int8)
+        self.owners = np.zeros((num_games, num_boxes + 1), dtype=np.int8)
+        self.scores = np.zeros((num_games, 2), dtype=np.int32)
+        self.turn = np.zeros(num_games, dtype=np.int8)
+        self.games_finished = 0
+
+    def reset(self, games=None) -> None:
+        """Reset all games, or only those selected by index/mask."""
+        if games is None:
+            games = slice(None)
+        self.edges[games] = False
+        self.sides[games] = 0
+        self.owners[games] = 0
+        self.scores[games] = 0
+        self.turn[games] = 0
+
+    def legal_moves(self) -> np.ndarray:
+        """(N, num_edges) mask of available moves."""
+        return ~self.edges
+
+    def analyze_moves(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (N, num_edges) counts of the boxes each move completes and gives
+        away, as in `Bases.analyze_moves`; zero for drawn edges.
+        """
+        return move_counts(self.sides, self.edge_boxes, self.legal_moves())
+
+    def step(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Apply one move per game.
+        Returns (rewards, done, results): boxes completed by each mover,
+        which games ended on this ply and their result index into
+        `RESULTS` (-1 while a game is still running). Finished games are
+        reset before returning.
+        """
+        actions = np.asarray(actions, dtype=np.intp)
+        games = self.rows[:, 0]
+        if self.edges[games, actions].any():
+            raise ValueError("Invalid move; line already exists.")
+        self.edges[games, actions] = True
+
+        boxes = self.edge_boxes[actions]
+        self.sides[self.rows, boxes] += 1
+        closed = self.sides[self.rows, boxes] == 4
+        closed[boxes == self.tables.num_boxes] = False
+        self.owners[self.rows, boxes] = np.where(
+            closed, self.turn[:, None] + 1, self.owners[self.rows, boxes])
+        rewards = closed.sum(axis=1)
+        self.scores[games, self.turn] += rewards
+        self.turn ^= 1
+
+        done = self.edges.all(axis=1)
+        results = np.full(self.num_games, -1, dtype=np.int8)
+        if done.any():
+            score_a, score_b = self.scores[done, 0], self.scores[done, 1]
+            results[done] = np.where(score_a > score_b, 0,
+                                     np.where(score_a < score_b, 1, 2))
+            self.games_finished += int(done.sum())
+            self.reset(done)
+        return rewards, done, results
+
+    def available_moves(self, game: int) -> list:
+        """Available moves of one game as line tuples."""
+        return [self.tables.edges[edge]
+                for edge in np.flatnonzero(~self.edges[game])]
+
+    def get_state_key(self, game: int) -> int:
+        """Same integer state key as `Bases.get_state_key`."""
+        num_boxes = self.tables.num_boxes
+        key = int.from_bytes(
+            np.packbits(self.edges[game], bitorder='little').tobytes(),
+            'little')
+        for box in np.flatnonzero(self.owners[game, :num_boxes]):
+            key |= int(self.owners[game, box]) << \
+                self.tables.num_edges + 2 * int(box)
+        return key
+
+    def get_detailed_state(self, game: int):
+        """Same (lines, boxes) state as `Bases.get_detailed_state`."""
+        size = self.size
+        owners = self.owners[game]
+        return (
+            tuple(sorted(self.tables.edges[edge]
+                         for edge in np.flatnonzero(self.edges[game]))),
+            tuple(tuple(OWNERS[owners[row * size + col]]
+                        for col in range(size))
+                  for row in range(size))
+        )
+
+
+def padded_edge_boxes(tables) -> np.ndarray:
+    """(num_edges, 2) boxes of each edge; edges on the border touch one
+    box and are padded with a sink column, index num_boxes."""
+    edge_boxes = np.full((tables.num_edges, 2), tables.num_boxes,
+                         dtype=np.intp)
+    for edge, boxes in enumerate(tables.edge_boxes):
+        edge_boxes[edge, :len(boxes)] = boxes
+    return edge_boxes
+
+
+def move_counts(sides: np.ndarray, edge_boxes: np.ndarray,
+                legal: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(completes, gives_away) box counts of every legal move, from
+    (N, num_boxes + 1) side counts and `padded_edge_boxes`."""
+    adjacent = sides[:, edge_boxes]  # (N, num_edges, 2)
+    # The sink column of border edges counts their draws; skip it
+    real = edge_boxes < sides.shape[1] - 1
+    completes = ((adjacent == 3) & real).sum(axis=2) * legal
+    gives_away = ((adjacent == 2) & real).sum(axis=2) * legal
+    return completes, gives_away
+
+
+def tactical_ties(best: np.ndarray, completes: np.ndarray,
+                  gives_away: np.ndarray) -> np.ndarray:
+    """Keep the moves of the (N, num_edges) mask `best` with the highest
+    `QLearningAgent.enhance_reward` in each row."""
+    rewards = np.where(best, (completes > 0) - 0.5 * (gives_away > 0),
+                       -np.inf)
+    return best & (rewards == rewards.max(axis=1, keepdims=True))
+
+
+def random_legal_actions(legal: np.ndarray) -> np.ndarray:
+    """Pick a uniformly random legal edge id for every row of `legal`."""
+    noise = np.random.random(legal.shape)
+    noise[~legal] = -1
+    return noise.argmax(axis=1)
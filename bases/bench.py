@@ -0,0 +1,304 @@
+"""
+Benchmarks of the engine, agents and training loop.
+
+    python -m bases.bench --output bench.json
+    python -m bases.bench --baseline bench.json
+
+Each metric is recorded as {'value', 'unit', 'higher_is_better'} under
+a "<size>x<size>/<name>" key. With --baseline, metrics that are worse
+than the baseline by more than --tolerance are reported and the exit
+status is 1.
+"""
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from .agent import QLearningAgent, RandomAgent
+from .game import Bases
+from .logs import MoveLogWriter, configure_logging, set_move_log
+
+SIZES = (3, 4, 5, 6)
+TABLE_SIZES = (1000, 10000, 100000)
+EPISODE_COUNTS = (100, 1000)
+BENCH_LOG = os.path.join(tempfile.gettempdir(), 'bases-bench.log')
+
+
+def _rate(function, min_time: float, repeat: int = 3) -> float:
+    """Calls per second of `function`: the best of `repeat` rounds that
+    together take at least `min_time`."""
+    best = 0.0
+    for _ in range(repeat):
+        calls, start = 0, time.perf_counter()
+        while True:
+            function()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time / repeat:
+                break
+        best = max(best, calls / elapsed)
+    return best
+
+
+def _seconds(function, repeat: int = 3) -> float:
+    """Fastest of `repeat` timed calls of `function`."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _random_position(game: Bases, rng: random.Random) -> None:
+    """Reset `game` and play a random number of random moves."""
+    game.reset()
+    for edge in rng.sample(range(game.tables.num_edges),
+                           rng.randrange(game.tables.num_edges)):
+        game.draw_edge(edge)
+        game.turn = 'B' if game.turn == 'A' else 'A'
+
+
+def _position(game: Bases, drawn: int) -> Bases:
+    """Copy of `game` reset and brought to the edges of `drawn` with
+    `draw_edge`, so box counts and owners match the edges."""
+    game.reset()
+    for edge in range(game.tables.num_edges):
+        if drawn >> edge & 1:
+            game.draw_edge(edge)
+            game.turn = 'B' if game.turn == 'A' else 'A'
+    return game.clone()
+
+
+def _fill_q_table(agent: QLearningAgent, states: int,
+                  rng: random.Random) -> list[int]:
+    """Add `states` random canonical rows; returns their raw keys."""
+    tables = agent.tables
+    keys = []
+    while len(agent.q_table) < states:
+        drawn = rng.getrandbits(tables.num_edges)
+        key, _ = agent.canonical_state(drawn)
+        row = agent.new_row()
+        for edge in range(tables.num_edges):
+            row[edge] = rng.random()
+        agent.q_table[key] = row
+        keys.append(drawn)
+    return keys
+
+
+def bench_engine(size: int, min_time: float) -> dict:
+    rng = random.Random(size)
+    game = Bases(size)
+    tables = game.tables
+    metrics = {}
+
+    moves = list(tables.edges)
+
+    def fill_board():
+        game.reset()
+        rng.shuffle(moves)
+        for move in moves:
+            game.make_move(*move)
+    metrics['make_move'] = (_rate(fill_board, min_time) * tables.num_edges,
+                            'moves/s', True)
+
+    _random_position(game, rng)
+    metrics['available_moves'] = (_rate(game.available_moves, min_time),
+                                  'calls/s', True)
+    metrics['analyze_moves'] = (_rate(game.analyze_moves, min_time),
+                                'calls/s', True)
+
+    free = [edge for edge in range(tables.num_edges)
+            if not game.drawn >> edge & 1]
+
+    def make_unmake():
+        for edge in free:
+            game.draw_edge(edge)
+            game.unmake_move()
+    metrics['make_unmake'] = (1e6 / (_rate(make_unmake, min_time) *
+                                     len(free)), 'us/ply', False)
+    metrics['clone'] = (1e6 / _rate(game.clone, min_time), 'us/call', False)
+
+    players = (RandomAgent(), RandomAgent())
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            metrics['play'] = (_rate(lambda: game.play(*players), min_time),
+                               'games/s', True)
+    metrics['simulate'] = (_rate(lambda: game.simulate(*players), min_time),
+                           'games/s', True)
+
+    agent = QLearningAgent(size)
+    states = []
+    for _ in range(200):
+        _random_position(game, rng)
+        states.append(game.get_state_key())
+    index = [0]
+
+    def canonical():
+        index[0] = (index[0] + 1) % len(states)
+        return agent.symmetrical_states(states[index[0]])
+    metrics['symmetrical_states'] = (1e6 / _rate(canonical, min_time),
+                                     'us/call', False)
+    return metrics
+
+
+def bench_agent(size: int, min_time: float, table_sizes) -> dict:
+    """choose_action/update latency with Q-tables of several sizes, and
+    save_policy/load_policy time for the largest one."""
+    rng = random.Random(size)
+    game = Bases(size)
+    metrics = {}
+    agent = QLearningAgent(size, exploration_rate=0.0)
+    for states in table_sizes:
+        keys = _fill_q_table(agent, states, rng)
+        # Positions on the edges of table rows; closed boxes give their
+        # state owners, so the row of each actual state is added too
+        positions, updates = [], []
+        for drawn in keys[:200]:
+            if drawn == game.tables.full_mask:
+                continue
+            position = _position(game, drawn)
+            state = position.get_state_key()
+            key, _ = agent.canonical_state(state)
+            if key not in agent.q_table:
+                row = agent.new_row()
+                for edge in range(game.tables.num_edges):
+                    row[edge] = rng.random()
+                agent.q_table[key] = row
+            moves = position.available_moves()
+            position.draw_edge(game.tables.edge_index[moves[0]])
+            updates.append((state, moves[0], position.get_state_key(),
+                            moves[1:]))
+            position.unmake_move()
+            positions.append(position)
+        index = [0]
+
+        def choose():
+            index[0] = (index[0] + 1) % len(positions)
+            return agent.choose_action(positions[index[0]])
+
+        def update():
+            index[0] = (index[0] + 1) % len(updates)
+            state, move, next_state, moves = updates[index[0]]
+            agent.update(state, move, 0, next_state, moves)
+
+        label = f"{states // 1000}k" if states >= 1000 else str(states)
+        metrics[f'choose_action_{label}'] = \
+            (1e6 / _rate(choose, min_time), 'us/call', False)
+        metrics[f'update_{label}'] = \
+            (1e6 / _rate(update, min_time), 'us/call', False)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'policy.bin')
+        metrics['save_policy'] = (_seconds(lambda: agent.save_policy(path)),
+                                  's', False)
+        loaded = QLearningAgent(size)
+
+        def load():
+            loaded.load_policy(path)
+            for drawn in range(100):
+                loaded.q_table.get(drawn)
+            loaded.q_table.close()
+        metrics['load_policy'] = (_seconds(load, 5), 's', False)
+    return metrics
+
+
+def bench_training(size: int, episode_counts) -> dict:
+    """Peak traced memory of training against `RandomAgent`."""
+    metrics = {}
+    for episodes in episode_counts:
+        random.seed(size)
+        agent = QLearningAgent(size, 0.5, 0.9, 0.1)
+        game = Bases(size)
+        tracemalloc.start()
+        for _ in range(episodes):
+            game.simulate(agent, RandomAgent())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        metrics[f'peak_memory_{episodes}_episodes'] = \
+            (peak / 2**20, 'MiB', False)
+    return metrics
+
+
+def run(sizes=SIZES, min_time: float = 0.5, table_sizes=TABLE_SIZES,
+        episode_counts=EPISODE_COUNTS) -> dict:
+    """Run every benchmark for each grid size. Games log to
+    `BENCH_LOG` instead of the configured game.log."""
+    configure_logging('train', BENCH_LOG)
+    previous = set_move_log(MoveLogWriter(os.devnull, buffer_games=1000))
+    results = {'meta': {'python': platform.python_version(),
+                        'platform': platform.platform(),
+                        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'min_time': min_time},
+               'metrics': {}}
+    try:
+        for size in sizes:
+            for suite in (bench_engine(size, min_time),
+                          bench_agent(size, min_time, table_sizes),
+                          bench_training(size, episode_counts)):
+                for name, (value, unit, higher) in suite.items():
+                    key = f"{size}x{size}/{name}"
+                    results['metrics'][key] = {'value': value, 'unit': unit,
+                                               'higher_is_better': higher}
+                    print(f"{key:<40} {value:>14.3f} {unit}")
+    finally:
+        set_move_log(previous)
+    return results
+
+
+def compare(results: dict, baseline: dict,
+            tolerance: float = 0.25) -> list[str]:
+    """Names of metrics worse than `baseline` by more than `tolerance`."""
+    regressions = []
+    for key, metric in results['metrics'].items():
+        reference = baseline['metrics'].get(key)
+        if reference is None or reference['value'] == 0:
+            continue
+        change = metric['value'] / reference['value'] - 1
+        if not metric['higher_is_better']:
+            change = -change
+        status = 'REGRESSION' if change < -tolerance else ''
+        print(f"{key:<40} {reference['value']:>12.3f} ->",
+              f"{metric['value']:>12.3f} {metric['unit']:<8}",
+              f"{change:+7.1%} {status}")
+        if status:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Bases engine, agents and training.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help="boxes per side")
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help="seconds per timing")
+    parser.add_argument('--table-sizes', type=int, nargs='+',
+                        default=TABLE_SIZES)
+    parser.add_argument('--episodes', type=int, nargs='+',
+                        default=EPISODE_COUNTS)
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--baseline', help="compare with a results JSON")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.min_time, args.table_sizes,
+                  args.episodes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond",
+                  f"{args.tolerance:.0%}")
+            sys.exit(1)
@@ -0,0 +1,192 @@
+import random
+from functools import lru_cache
+
+
+class BoardTables:
+    """
+    Precomputed edge/box adjacency for one grid size.
+
+    Edges are numbered in the order `Bases.available_moves` lists them:
+    horizontal lines row by row, then vertical lines column by column.
+    Boxes are numbered row-major (box id = row * size + col).
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.num_boxes = size * size
+        self.num_horizontal = (size + 1) * size
+        self.num_edges = 2 * size * (size + 1)
+        self.full_mask = (1 << self.num_edges) - 1
+
+        edges = []
+        # Horizontal lines
+        for row in range(size + 1):
+            for col in range(size):
+                edges.append((col, row, col + 1, row))
+        # Vertical lines
+        for col in range(size + 1):
+            for row in range(size):
+                edges.append((col, row, col, row + 1))
+        self.edges = tuple(edges)
+
+        # Both orientations of a line map to the same edge id
+        self.edge_index = {}
+        for edge, (x1, y1, x2, y2) in enumerate(edges):
+            self.edge_index[(x1, y1, x2, y2)] = edge
+            self.edge_index[(x2, y2, x1, y1)] = edge
+
+        box_edges = []
+        for row in range(size):
+            for col in range(size):
+                box_edges.append((
+                    self.horizontal(col, row),
+                    self.horizontal(col, row + 1),
+                    self.vertical(col, row),
+                    self.vertical(col + 1, row),
+                ))
+        self.box_edges = tuple(box_edges)
+        self.box_masks = tuple(sum(1 << edge for edge in sides)
+                               for sides in box_edges)
+
+        edge_boxes = [[] for _ in range(self.num_edges)]
+        for box, sides in enumerate(box_edges):
+            for edge in sides:
+                edge_boxes[edge].append(box)
+        self.edge_boxes = tuple(tuple(boxes) for boxes in edge_boxes)
+
+        # Zobrist keys per edge. The turn alternates after every move, so
+        # the drawn edges alone determine the side to move and the rest
+        # of the game; box owners only affect the score so far.
+        rng = random.Random(size)
+        self.zobrist = tuple(rng.getrandbits(64)
+                             for _ in range(self.num_edges))
+
+    def horizontal(self, col: int, row: int) -> int:
+        """Edge id of the line (col, row) - (col + 1, row)."""
+        return row * self.size + col
+
+    def vertical(self, col: int, row: int) -> int:
+        """Edge id of the line (col, row) - (col, row + 1)."""
+        return self.num_horizontal + col * self.size + row
+
+    def completed_boxes(self, drawn: int, edge: int) -> int:
+        """Number of boxes closed by adding `edge` to the `drawn` mask."""
+        drawn |= 1 << edge
+        completed = 0
+        for box in self.edge_boxes[edge]:
+            mask = self.box_masks[box]
+            if drawn & mask == mask:
+                completed += 1
+        return completed
+
+
+@lru_cache(maxsize=None)
+def board_tables(size: int) -> BoardTables:
+    """Shared, immutable adjacency tables for a `size` x `size` box grid."""
+    return BoardTables(size)
+
+
+class SymmetryTables:
+    """
+    Edge and box permutations for the 8 symmetries of the square board
+    (identity, three rotations, a reflection and its three rotations, in
+    the order of `QLearningAgent.generate_rotations_and_reflections`).
+
+    `edge_perms[sym][edge]` is the image of an edge under `sym`, likewise
+    `box_perms` for boxes. `byte_tables[sym][i][byte]` holds the permuted
+    bits of byte `i` of an integer state key (edge bits followed by two
+    owner bits per box), so a whole key is permuted with one table lookup
+    per non-zero byte.
+    """
+
+    def __init__(self, size: int):
+        tables = board_tables(size)
+        self.size = size
+        self.key_bits = tables.num_edges + 2 * tables.num_boxes
+        self.key_bytes = (self.key_bits + 7) // 8
+
+        def rotate90(x, y):
+            return y, size - x
+
+        def reflect(x, y):
+            return x, size - y
+
+        def compose(first, times):
+            def transform(x, y):
+                x, y = first(x, y)
+                for _ in range(times):
+                    x, y = rotate90(x, y)
+                return x, y
+            return transform
+
+        transforms = [compose(first, times)
+                      for first in (lambda x, y: (x, y), reflect)
+                      for times in range(4)]
+
+        edge_perms, box_perms, byte_tables = [], [], []
+        for transform in transforms:
+            edge_perm = tuple(
+                tables.edge_index[(*transform(x1, y1), *transform(x2, y2))]
+                for x1, y1, x2, y2 in tables.edges)
+            box_perm = []
+            for box in range(tables.num_boxes):
+                row, col = divmod(box, size)
+                x1, y1 = transform(col, row)
+                x2, y2 = transform(col + 1, row + 1)
+                box_perm.append(min(y1, y2) * size + min(x1, x2))
+            box_perm = tuple(box_perm)
+
+            bit_perm = list(edge_perm)
+            for box in range(tables.num_boxes):
+                for bit in range(2):
+                    bit_perm.append(tables.num_edges + 2 * box_perm[box] + bit)
+            byte_tables.append(self._byte_tables(bit_perm))
+            edge_perms.append(edge_perm)
+            box_perms.append(box_perm)
+
+        self.edge_perms = tuple(edge_perms)
+        self.box_perms = tuple(box_perms)
+        self.byte_tables = tuple(byte_tables)
+
+    def _byte_tables(self, bit_perm: list[int]) -> tuple:
+        byte_tables = []
+        for offset in range(0, self.key_bits, 8):
+            lookup = [0] * 256
+            for value in range(1, 256):
+                low = (value & -value).bit_length() - 1
+                target = offset + low
+                bit = 1 << bit_perm[target] if target < self.key_bits else 0
+                lookup[value] = lookup[value & (value - 1)] | bit
+            byte_tables.append(tuple(lookup))
+        return tuple(byte_tables)
+
+    def permute(self, key: int, sym: int) -> int:
+        """Image of an integer state key under symmetry `sym`."""
+        permuted = 0
+        for lookup, byte in zip(self.byte_tables[sym],
+                                key.to_bytes(self.key_bytes, 'little')):
+            if byte:
+                permuted |= lookup[byte]
+        return permuted
+
+    def canonical(self, key: int) -> tuple[int, int]:
+        """
+        (canonical key, symmetry) where the canonical key is the smallest
+        image of `key` and `edge_perms[symmetry]` maps edges into its frame.
+        """
+        data = key.to_bytes(self.key_bytes, 'little')
+        best, best_sym = key, 0
+        for sym in range(1, 8):
+            permuted = 0
+            for lookup, byte in zip(self.byte_tables[sym], data):
+                if byte:
+                    permuted |= lookup[byte]
+            if permuted < best:
+                best, best_sym = permuted, sym
+        return best, best_sym
+
+
+@lru_cache(maxsize=None)
+def symmetry_tables(size: int) -> SymmetryTables:
+    """Shared symmetry permutation tables for a grid size."""
+    return SymmetryTables(size)
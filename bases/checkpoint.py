@@ -0,0 +1,352 @@
+import multiprocessing as mp
+import os
+import pickle
+import random
+import struct
+import sys
+from array import array
+import numpy as np
+from .policy import HEADER, MAGIC, VERSION, MappedQTable, key_bytes
+
+# Delta segment: header, sorted big-endian state keys, then one float32 row
+# of Q-values per key (the same layout as the body of a binary policy)
+SEGMENT = struct.Struct('<4sIQ')  # magic, states, episode
+SEGMENT_MAGIC = b'BQTD'
+# Deletion segment: the same header and keys, no rows
+DELETED_MAGIC = b'BQTX'
+STATE_FILE = 'state.pkl'
+SEATS = ('a', 'b')
+# Compact once the deltas are at least as big as the base (and 1 MiB)
+MIN_COMPACT_BYTES = 1 << 20
+
+
+class TrackedQTable(dict):
+    """Q-table dict that records the states assigned since the last
+    checkpoint in `dirty` and those deleted (evicted or pruned) in
+    `deleted`."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.dirty = set()
+        self.deleted = set()
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.dirty.add(key)
+        self.deleted.discard(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.dirty.discard(key)
+        self.deleted.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.dirty.discard(key)
+            self.deleted.add(key)
+        return dict.pop(self, key, *default)
+
+
+def append_segment(path, q_table, states, grid_size: int, episode: int,
+                   deleted=()) -> None:
+    """Append the rows of `states` and the `deleted` states to a delta
+    file and sync it."""
+    width = key_bytes(grid_size)
+    chunks = []
+    if deleted:
+        deleted = sorted(deleted)
+        chunks.append(SEGMENT.pack(DELETED_MAGIC, len(deleted), episode))
+        chunks.extend(state.to_bytes(width, 'big') for state in deleted)
+    states = sorted(state for state in states if state in q_table)
+    chunks.append(SEGMENT.pack(SEGMENT_MAGIC, len(states), episode))
+    chunks.extend(state.to_bytes(width, 'big') for state in states)
+    for state in states:
+        values = array('f', q_table[state])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        chunks.append(values.tobytes())
+    with open(path, 'ab') as f:
+        f.write(b''.join(chunks))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _segments(data: bytes, width: int, row_bytes: int):
+    """(magic, count, episode, keys start, rows start, end) of each
+    complete segment of delta file contents, up to the first damaged
+    one."""
+    offset = 0
+    while offset + SEGMENT.size <= len(data):
+        magic, count, episode = SEGMENT.unpack_from(data, offset)
+        keys_start = offset + SEGMENT.size
+        rows_start = keys_start + count * width
+        end = rows_start
+        if magic == SEGMENT_MAGIC:
+            end += count * row_bytes
+        elif magic != DELETED_MAGIC:
+            return
+        if end > len(data):
+            return
+        yield magic, count, episode, keys_start, rows_start, end
+        offset = end
+
+
+def read_segments(path, grid_size: int, num_edges: int,
+                  max_episode: int | None = None):
+    """
+    (state, values) of every delta segment in file order, so later rows
+    replace earlier ones; values is None for a deleted state. Segments
+    after `max_episode` and a segment cut short by a crash are skipped.
+    """
+    width = key_bytes(grid_size)
+    row_bytes = 4 * num_edges
+    with open(path, 'rb') as f:
+        data = f.read()
+    for magic, count, episode, keys_start, rows_start, _ in \
+            _segments(data, width, row_bytes):
+        if max_episode is not None and episode > max_episode:
+            continue
+        for index in range(count):
+            key_start = keys_start + index * width
+            state = int.from_bytes(data[key_start:key_start + width], 'big')
+            if magic == DELETED_MAGIC:
+                yield state, None
+                continue
+            row_start = rows_start + index * row_bytes
+            values = array('f', data[row_start:row_start + row_bytes])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            yield state, values
+
+
+def truncate_segments(path, grid_size: int, num_edges: int,
+                      max_episode: int) -> None:
+    """
+    Cut a delta file after its last complete segment up to
+    `max_episode`, dropping what a crashed run appended after its last
+    state.pkl (a resumed run would write the same episode numbers).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    valid = 0
+    for _, _, episode, _, _, end in _segments(data, key_bytes(grid_size),
+                                              4 * num_edges):
+        if episode > max_episode:
+            break
+        valid = end
+    if valid < len(data):
+        with open(path, 'r+b') as f:
+            f.truncate(valid)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def compact(base_path, delta_path, grid_size: int, num_edges: int,
+            learning_rate: float, discount_factor: float,
+            exploration_rate: float) -> None:
+    """
+    Merge a delta file into the binary policy at `base_path` and remove
+    it. Base and updates are merged in key order in two streaming
+    passes (keys, then rows), so only the delta is held in memory.
+    Deleted states are left out.
+    """
+    updates = {}
+    for state, values in read_segments(delta_path, grid_size, num_edges):
+        updates[state] = values
+    base = MappedQTable(base_path) if os.path.exists(base_path) else None
+    width = key_bytes(grid_size)
+    base_count = 0 if base is None else base.num_states
+
+    def base_key(row):
+        start = HEADER.size + row * width
+        return int.from_bytes(base._mm[start:start + width], 'big')
+
+    def merged():
+        """(state, row in base or -1) in key order."""
+        row, pending = 0, sorted(updates)
+        index = 0
+        while row < base_count or index < len(pending):
+            key = base_key(row) if row < base_count else None
+            if index < len(pending) and (key is None or
+                                         pending[index] <= key):
+                state = pending[index]
+                index += 1
+                if state == key:
+                    row += 1
+                if updates[state] is not None:
+                    yield state, -1
+            else:
+                row += 1
+                if key not in updates:
+                    yield key, row - 1
+
+    count = sum(1 for _ in merged())
+    temp_path = f"{base_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, grid_size, num_edges, width,
+                            count, learning_rate, discount_factor,
+                            exploration_rate))
+        for state, _ in merged():
+            f.write(state.to_bytes(width, 'big'))
+        for state, row in merged():
+            if row < 0:
+                values = updates[state]
+                if sys.byteorder == 'big':
+                    values = array('f', values)
+                    values.byteswap()
+                f.write(values.tobytes())
+            else:
+                start = base._values_offset + row * base._row_bytes
+                f.write(base._mm[start:start + base._row_bytes])
+        f.flush()
+        os.fsync(f.fileno())
+    if base is not None:
+        base.close()
+    os.replace(temp_path, base_path)
+    os.remove(delta_path)
+
+
+class Checkpointer:
+    """
+    Incremental checkpoints of two training agents in `directory`.
+
+    Every `every` episodes the Q-table rows changed since the previous
+    checkpoint are appended to a.delta / b.delta, then the episode
+    count, win counts, `random`/NumPy RNG states and the agents'
+    `state_visits` are written to state.pkl. Deleted (evicted or
+    pruned) states are recorded too, so they stay deleted on restore.
+    Once a delta file outgrows its base, it is merged into a.bin / b.bin
+    (binary policies usable with `load_policy`) by a background process
+    while training goes on. `restore` loads base and deltas back into
+    the agents, first cutting what a crashed run appended to the deltas
+    after its last state.pkl.
+    """
+
+    def __init__(self, directory, agents, every: int = 1000):
+        self.directory = str(directory)
+        self.agents = dict(zip(SEATS, agents))
+        self.every = every
+        self.last_episode = 0
+        self._compactor = None
+        os.makedirs(self.directory, exist_ok=True)
+        for agent in agents:
+            agent.q_table = TrackedQTable(agent.q_table)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path(STATE_FILE))
+
+    def clear(self) -> None:
+        """Delete the checkpoint, to start a new run in its directory."""
+        self.wait()
+        for name in os.listdir(self.directory):
+            if name == STATE_FILE or name.split('.')[0] in SEATS:
+                os.remove(self._path(name))
+        self.last_episode = 0
+
+    def restore(self) -> dict | None:
+        """Load the last checkpoint into the agents and RNGs; returns its
+        state ({'episode', 'wins', ...}) or None if there is none."""
+        if not self.exists():
+            return None
+        self.wait()
+        with open(self._path(STATE_FILE), 'rb') as f:
+            state = pickle.load(f)
+        for seat, agent in self.agents.items():
+            table = TrackedQTable()
+            base_path = self._path(f"{seat}.bin")
+            if os.path.exists(base_path):
+                base = MappedQTable(base_path)
+                for key, values in base.items():
+                    dict.__setitem__(table, key, values)
+                base.close()
+            # A delta whose compaction did not finish, then the live one
+            for name in (f"{seat}.delta.compacting", f"{seat}.delta"):
+                if os.path.exists(self._path(name)):
+                    truncate_segments(self._path(name), agent.grid_size,
+                                      agent.tables.num_edges,
+                                      state['episode'])
+                    for key, values in read_segments(
+                            self._path(name), agent.grid_size,
+                            agent.tables.num_edges, state['episode']):
+                        if values is None:
+                            dict.pop(table, key, None)
+                        else:
+                            dict.__setitem__(table, key, values)
+            agent.q_table = table
+            if agent.state_visits is not None:
+                agent.state_visits = dict(
+                    state.get('visits', {}).get(seat) or {})
+        random.setstate(state['random'])
+        np.random.set_state(state['numpy'])
+        self.last_episode = state['episode']
+        return state
+
+    def maybe_save(self, episode: int, wins: dict) -> None:
+        if episode - self.last_episode >= self.every:
+            self.save(episode, wins)
+
+    def save(self, episode: int, wins: dict) -> None:
+        for seat, agent in self.agents.items():
+            table = agent.q_table
+            if table.dirty or table.deleted:
+                append_segment(self._path(f"{seat}.delta"), table,
+                               table.dirty, agent.grid_size, episode,
+                               table.deleted)
+                table.dirty = set()
+                table.deleted = set()
+        state = {'episode': episode, 'wins': dict(wins),
+                 'random': random.getstate(),
+                 'numpy': np.random.get_state(),
+                 'visits': {seat: agent.state_visits
+                            for seat, agent in self.agents.items()}}
+        temp_path = self._path(f"{STATE_FILE}.tmp")
+        with open(temp_path, 'wb') as f:
+            pickle.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path(STATE_FILE))
+        self.last_episode = episode
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if self._compactor is not None:
+            if self._compactor.is_alive():
+                return
+            self._compactor.join()
+            self._compactor = None
+        jobs = []
+        for seat, agent in self.agents.items():
+            base_path = self._path(f"{seat}.bin")
+            delta_path = self._path(f"{seat}.delta")
+            compacting = f"{delta_path}.compacting"
+            if not os.path.exists(compacting):
+                if not os.path.exists(delta_path):
+                    continue
+                base_size = os.path.getsize(base_path) \
+                    if os.path.exists(base_path) else 0
+                if os.path.getsize(delta_path) < max(base_size,
+                                                     MIN_COMPACT_BYTES):
+                    continue
+                # New checkpoints go to a fresh delta meanwhile
+                os.replace(delta_path, compacting)
+            jobs.append((base_path, compacting, agent.grid_size,
+                         agent.tables.num_edges, agent.learning_rate,
+                         agent.discount_factor, agent.exploration_rate))
+        if jobs:
+            self._compactor = mp.Process(target=_compact_all, args=(jobs,),
+                                         daemon=True)
+            self._compactor.start()
+
+    def wait(self) -> None:
+        """Wait for a running compaction."""
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+
+def _compact_all(jobs: list[tuple]) -> None:
+    for job in jobs:
+        compact(*job)
@@ -0,0 +1,90 @@
+import os
+from collections.abc import Mapping
+
+CONFIG_NAME = 'bases.yml'
+# Path of the settings file, and prefix of per-setting overrides such as
+# BASES_POLICY_PATH=/tmp/policy.bin (values are parsed as YAML)
+CONFIG_ENV = 'BASES_CONFIG'
+ENV_PREFIX = 'BASES_'
+# Settings holding file or directory paths; (section, key) for nested ones
+PATH_SETTINGS = ('game_log', 'lines_log', 'hyperparameter_tuning_results',
+                 'policy_path', 'checkpoint_dir',
+                 ('instrumentation', 'json_path'),
+                 ('instrumentation', 'profile_dir'))
+
+
+class Config(Mapping):
+    """
+    Settings from bases.yml, read on first access.
+
+    The file is the path given to `load`, else $BASES_CONFIG, else
+    bases.yml in the working directory, else the one next to the
+    package. BASES_<SETTING> environment variables override single
+    settings. Relative paths in the file (`PATH_SETTINGS`) are relative
+    to the file's directory, so the data of a run is found wherever it
+    is started from; overrides are taken as given.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._settings = None
+
+    @property
+    def path(self) -> str:
+        if self._path is not None:
+            return str(self._path)
+        if os.environ.get(CONFIG_ENV):
+            return os.environ[CONFIG_ENV]
+        if os.path.exists(CONFIG_NAME):
+            return CONFIG_NAME
+        package = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(os.path.dirname(package), CONFIG_NAME)
+
+    def load(self, path=None) -> 'Config':
+        """(Re)read the settings, from `path` if given."""
+        import yaml
+
+        if path is not None:
+            self._path = path
+        with open(self.path, 'r') as f:
+            settings = yaml.safe_load(f) or {}
+        _resolve_paths(settings, os.path.dirname(os.path.abspath(self.path)))
+        for name, value in os.environ.items():
+            if name.startswith(ENV_PREFIX) and name != CONFIG_ENV:
+                settings[name[len(ENV_PREFIX):].lower()] = \
+                    yaml.safe_load(value)
+        self._settings = settings
+        return self
+
+    def _loaded(self) -> dict:
+        if self._settings is None:
+            self.load()
+        return self._settings
+
+    def __getitem__(self, key):
+        return self._loaded()[key]
+
+    def __iter__(self):
+        return iter(self._loaded())
+
+    def __len__(self) -> int:
+        return len(self._loaded())
+
+
+def _resolve_paths(settings: dict, directory: str) -> None:
+    """Make the relative `PATH_SETTINGS` of `settings` absolute under
+    `directory`."""
+    for setting in PATH_SETTINGS:
+        section, key = setting if isinstance(setting, tuple) \
+            else (None, setting)
+        values = settings.get(section) if section else settings
+        if isinstance(values, dict) and values.get(key):
+            values[key] = os.path.join(directory,
+                                       os.path.expanduser(values[key]))
+
+
+def ensure_parent(path) -> None:
+    """Create the directory a data file is about to be written to."""
+    directory = os.path.dirname(os.fspath(path))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,223 @@
+import random
+from functools import lru_cache
+from .board import board_tables
+
+CHAIN, LOOP = 0, 1
+
+
+class Component:
+    """
+    A chain or loop of unclaimed boxes joined by undrawn lines.
+
+    `edges[i]` is the edge id at position i along the component. For a
+    chain of `length` boxes, position 0 is the line from the first box to
+    the edge of the board and position `length` the one from the last box
+    (None when that end box has no such free line), and position i in
+    between joins boxes i - 1 and i. For a loop position i joins boxes i
+    and i + 1 (mod `length`).
+    """
+
+    def __init__(self, kind: int, boxes: list[int], edges: list):
+        self.kind = kind
+        self.boxes = boxes
+        self.edges = edges
+        self.length = len(boxes)
+
+    def key(self) -> tuple:
+        """Orientation-free description used by the solver."""
+        if self.kind == LOOP:
+            return (LOOP, self.length, 0, 0)
+        return _chain_key(self.length, self.edges[0] is not None,
+                          self.edges[-1] is not None)
+
+
+def _chain_key(length: int, left: bool, right: bool) -> tuple:
+    return (CHAIN, length, *sorted((int(left), int(right))))
+
+
+def is_endgame(size: int, drawn: int) -> bool:
+    """True when every unclaimed box has at least two sides drawn, so the
+    position splits into independent chains and loops."""
+    tables = board_tables(size)
+    for mask in tables.box_masks:
+        if (drawn & mask).bit_count() < 2:
+            return False
+    return True
+
+
+def decompose(size: int, drawn: int) -> list[Component] | None:
+    """Chains and loops of a position, or None if it is not an endgame."""
+    if not is_endgame(size, drawn):
+        return None
+    tables = board_tables(size)
+
+    def free_edges(box):
+        return [edge for edge in tables.box_edges[box]
+                if not drawn >> edge & 1]
+
+    def neighbour(box, edge):
+        boxes = tables.edge_boxes[edge]
+        if len(boxes) == 1:
+            return None  # edge of the board
+        return boxes[0] if boxes[1] == box else boxes[1]
+
+    unclaimed = {box for box in range(tables.num_boxes)
+                 if free_edges(box)}
+    components = []
+    while unclaimed:
+        # Walk from an end box if there is one, else it is a loop
+        start = unclaimed.pop()
+        unclaimed.add(start)
+        group, stack = {start}, [start]
+        while stack:
+            box = stack.pop()
+            for edge in free_edges(box):
+                other = neighbour(box, edge)
+                if other is not None and other not in group:
+                    group.add(other)
+                    stack.append(other)
+
+        ends = [box for box in group
+                if sum(neighbour(box, edge) is not None
+                       for edge in free_edges(box)) < 2]
+        first = ends[0] if ends else start
+        boxes, edges = [first], []
+        if ends:
+            ground = [edge for edge in free_edges(first)
+                      if neighbour(first, edge) is None]
+            edges.append(ground.pop() if ground else None)
+        previous_edge = None
+        box = first
+        while True:
+            step = [edge for edge in free_edges(box)
+                    if edge != previous_edge and
+                    neighbour(box, edge) is not None]
+            if not step:
+                break
+            edge = step[0]
+            following = neighbour(box, edge)
+            edges.append(edge)
+            if following == first:
+                break  # closed the loop
+            boxes.append(following)
+            previous_edge, box = edge, following
+        if ends:
+            ground = [edge for edge in free_edges(box)
+                      if neighbour(box, edge) is None and
+                      edge not in edges]
+            edges.append(ground.pop() if ground else None)
+            components.append(Component(CHAIN, boxes, edges))
+        else:
+            components.append(Component(LOOP, boxes, edges))
+        unclaimed -= group
+    return components
+
+
+def _moves(key: tuple) -> list[tuple[int, int, tuple]]:
+    """(position, boxes completed, resulting component keys) per move."""
+    kind, length, left, right = key
+    if kind == LOOP:
+        return [(0, 0, (_chain_key(length, False, False),))]
+    moves = []
+    for position in range(0 if left else 1, length + 1 if right else length):
+        completed, parts = 0, []
+        for part_length, part_left, part_right in (
+                (position, left, 0), (length - position, 0, right)):
+            if part_length == 0:
+                continue
+            if part_length == 1 and not part_left and not part_right:
+                completed += 1
+            else:
+                parts.append(_chain_key(part_length, part_left, part_right))
+        moves.append((position, completed, tuple(parts)))
+    return moves
+
+
+@lru_cache(maxsize=None)
+def endgame_value(components: tuple) -> int:
+    """
+    Exact box margin for the player to move over a sorted tuple of
+    component keys. Turns alternate after every move, including moves
+    that complete a box, so the classic long-chain and double-dealing
+    rules do not apply; the value is found by negamax over the
+    component multiset instead.
+    """
+    if not components:
+        return 0
+    best = None
+    seen = set()
+    for index, key in enumerate(components):
+        if key in seen:
+            continue
+        seen.add(key)
+        rest = components[:index] + components[index + 1:]
+        for _, completed, parts in _moves(key):
+            value = completed - endgame_value(tuple(sorted(rest + parts)))
+            if best is None or value > best:
+                best = value
+    return best
+
+
+def solve_endgame(size: int, drawn: int) -> tuple[int, int, int] | None:
+    """
+    (margin, best edge, boxes left) for the player to move, or None if the
+    position is not an endgame. `margin` is the exact difference between
+    the boxes the player to move and the opponent will still take.
+    """
+    components = decompose(size, drawn)
+    if not components:
+        return None
+    keys = [component.key() for component in components]
+    best_value, best_edges = None, []
+    for index, component in enumerate(components):
+        rest = tuple(keys[:index] + keys[index + 1:])
+        left = component.edges[0] is not None
+        right = component.edges[-1] is not None
+        if component.kind == LOOP:
+            moves = [(position, 0, (_chain_key(component.length, 0, 0),))
+                     for position in range(component.length)]
+        else:
+            moves = _moves((CHAIN, component.length, left, right))
+        for position, completed, parts in moves:
+            value = completed - endgame_value(tuple(sorted(rest + parts)))
+            edge = component.edges[position]
+            if best_value is None or value > best_value:
+                best_value, best_edges = value, [edge]
+            elif value == best_value:
+                best_edges.append(edge)
+    boxes_left = sum(component.length for component in components)
+    return best_value, random.choice(best_edges), boxes_left
+
+
+def endgame_move(game) -> tuple[int, int, int, int] | None:
+    """Optimal move for `game` if it is in the endgame, else None."""
+    solution = solve_endgame(game.size, game.drawn)
+    if solution is None:
+        return None
+    return game.tables.edges[solution[1]]
+
+
+class EndgameAgent:
+    """
+    Plays the exact chain/loop solution once the position is an endgame
+    and defers to `fallback` (random moves by default) before that.
+    `last_margin` and `controller` describe the last solved position:
+    the exact remaining box margin for the player to move and who takes
+    the majority of the remaining boxes ('mover', 'opponent' or 'even').
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+        self.last_margin = None
+        self.controller = None
+
+    def choose_action(self, game) -> tuple[int, int, int, int]:
+        solution = solve_endgame(game.size, game.drawn)
+        if solution is None:
+            if self.fallback is not None:
+                return self.fallback.choose_action(game)
+            return random.choice(game.available_moves())
+        self.last_margin, edge, _ = solution
+        self.controller = 'mover' if self.last_margin > 0 else \
+            'opponent' if self.last_margin < 0 else 'even'
+        return game.tables.edges[edge]
@@ -1,38 +1,73 @@
 import bases
 import logging
-import csv
-from .agent import QLearningAgent
+from .agent import QLearningAgent, OWNER_CODES
+from .board import board_tables
+from .linear import LinearQAgent
+from .logs import configure_logging, move_log
 from .player import HumanPlayer
 from typing import Literal
 
 
+logger = logging.getLogger('bases')
+# Agents that learn from `update` and `finish_episode` during play
+LEARNING_AGENTS = (QLearningAgent, LinearQAgent)
+
+
 class Bases:
     game_counter = 0
 
     def __init__(self, size):
         self.size = size
+        self.tables = board_tables(size)
         self.lines = []
+        self.drawn = 0  # bitmask of drawn edge ids
+        self.box_sides = [0] * self.tables.num_boxes
+        self.owner_bits = 0  # 2 bits per box: 0 = nobody, 1 = A, 2 = B
+        self.zobrist = 0  # Zobrist hash of the drawn edges
         self.boxes = [[None] * size for _ in range(size)]
         self.scores = {'A': 0, 'B': 0}
         self.wins = {'A': 0, 'B': 0, 'Tie': 0}
         self.turn = 'A'
         self.turn_id = 1
+        self.history = []  # (edge, player) per drawn edge, for unmake_move
         self.game_id = None
-        logging.basicConfig(
-            filename=bases.cfg['game_log'],
-            filemode='w',
-            level=logging.DEBUG,
-            format='%(asctime)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        logging.info(f'Initialized Bases game with size {size}x{size}')
+        configure_logging()
+        logger.info('Initialized Bases game with size %dx%d', size, size)
 
     def reset(self) -> None:
         self.lines = []
+        self.drawn = 0
+        self.box_sides = [0] * self.tables.num_boxes
+        self.owner_bits = 0
+        self.zobrist = 0
         self.boxes = [[None] * self.size for _ in range(self.size)]
         self.scores = {'A': 0, 'B': 0}
         self.turn = 'A'
         self.turn_id = 1
+        self.history = []
+
+    def clone(self) -> 'Bases':
+        """
+        Copy of the game for lookahead, made without logging. The
+        adjacency tables are shared; the line records are shared too, as
+        they are never changed once appended.
+        """
+        game = Bases.__new__(Bases)
+        game.size = self.size
+        game.tables = self.tables
+        game.lines = self.lines.copy()
+        game.drawn = self.drawn
+        game.box_sides = self.box_sides.copy()
+        game.owner_bits = self.owner_bits
+        game.zobrist = self.zobrist
+        game.boxes = [row.copy() for row in self.boxes]
+        game.scores = self.scores.copy()
+        game.wins = self.wins.copy()
+        game.turn = self.turn
+        game.turn_id = self.turn_id
+        game.history = self.history.copy()
+        game.game_id = self.game_id
+        return game
 
     def print_board(self) -> None:
         delimiter = "-" * (self.size * 4 + 1)
@@ -61,52 +96,118 @@ class Bases:
             else:
                 board += '   '
         board += '*\n' + delimiter
-        logging.debug("Board state:\n" + board)
+        logger.debug("Board state:\n%s", board)
         print(board)
 
     def is_line_drawn(self, x1, y1, x2, y2) -> bool:
         """x, y are column, row"""
-        return any(
-            (line['x1'], line['y1'], line['x2'], line['y2']) in
-            [(x1, y1, x2, y2), (x2, y2, x1, y1)]
-            for line in self.lines
-        )
+        edge = self.tables.edge_index.get((x1, y1, x2, y2))
+        return edge is not None and bool(self.drawn >> edge & 1)
 
     def check_and_update_box(self, row, col) -> bool:
-        if (self.is_line_drawn(col, row, col + 1, row) and
-                self.is_line_drawn(col, row+1, col + 1, row+1) and
-                self.is_line_drawn(col, row, col, row + 1) and
-                self.is_line_drawn(col + 1, row, col + 1, row + 1) and
-                self.boxes[row][col] is None):
+        mask = self.tables.box_masks[row * self.size + col]
+        if self.drawn & mask == mask and self.boxes[row][col] is None:
             self.boxes[row][col] = self.turn
+            self.owner_bits |= OWNER_CODES[self.turn] << \
+                2 * (row * self.size + col)
             self.scores[self.turn] += 1
             return True
         return False
 
     def available_moves(self) -> list:
-        moves = []
-        # Horizontal lines
-        for row in range(self.size + 1):
-            for col in range(self.size):
-                if not self.is_line_drawn(col, row, col+1, row):
-                    moves.append((col, row, col+1, row))
-        # Vertical lines
-        for col in range(self.size + 1):
-            for row in range(self.size):
-                if not self.is_line_drawn(col, row, col, row+1):
-                    moves.append((col, row, col, row+1))
-        return moves
+        # Edge ids list horizontal lines first, then vertical lines
+        drawn = self.drawn
+        return [line for edge, line in enumerate(self.tables.edges)
+                if not drawn >> edge & 1]
+
+    def draw_edge(self, edge: int) -> int:
+        """
+        Draw `edge` for the current player and claim the boxes it closes.
+        Only the (at most two) boxes adjacent to the edge are touched.
+        Returns the number of boxes completed.
+        """
+        self.drawn |= 1 << edge
+        self.zobrist ^= self.tables.zobrist[edge]
+        self.history.append((edge, self.turn))
+        completed = 0
+        box_sides = self.box_sides
+        for box in self.tables.edge_boxes[edge]:
+            box_sides[box] += 1
+            if box_sides[box] == 4:
+                row, col = divmod(box, self.size)
+                self.boxes[row][col] = self.turn
+                self.owner_bits |= OWNER_CODES[self.turn] << 2 * box
+                completed += 1
+        self.scores[self.turn] += completed
+        return completed
+
+    def unmake_move(self) -> tuple[int, int, int, int]:
+        """
+        Take back the last drawn edge: its boxes, score, line record and
+        `turn_id` are restored, and the turn goes back to the player who
+        drew it. Nothing is logged. Returns the line taken back.
+        """
+        if not self.history:
+            raise ValueError("No move to take back")
+        edge, player = self.history.pop()
+        self.drawn &= ~(1 << edge)
+        self.zobrist ^= self.tables.zobrist[edge]
+        box_sides = self.box_sides
+        for box in self.tables.edge_boxes[edge]:
+            if box_sides[box] == 4:
+                row, col = divmod(box, self.size)
+                self.boxes[row][col] = None
+                self.owner_bits &= ~(3 << 2 * box)
+                self.scores[player] -= 1
+            box_sides[box] -= 1
+        line = self.tables.edges[edge]
+        # `make_move` and `simulate` record the line before drawing it
+        if self.lines:
+            last = self.lines[-1]
+            if (last['x1'], last['y1'], last['x2'], last['y2']) == line:
+                self.lines.pop()
+                self.turn_id = last['turn_id']
+        self.turn = player
+        return line
+
+    def analyze_moves(self) -> list[tuple[tuple, int, int]]:
+        """
+        (move, boxes it completes, boxes it gives away) for every
+        available move, in one pass over the box side counts kept by
+        `draw_edge`: a move completes its adjacent boxes that have three
+        sides and hands the opponent, who moves next, those with two.
+        """
+        drawn, box_sides = self.drawn, self.box_sides
+        edges, edge_boxes = self.tables.edges, self.tables.edge_boxes
+        analysis = []
+        for edge in range(self.tables.num_edges):
+            if drawn >> edge & 1:
+                continue
+            completes = gives_away = 0
+            for box in edge_boxes[edge]:
+                sides = box_sides[box]
+                if sides == 3:
+                    completes += 1
+                elif sides == 2:
+                    gives_away += 1
+            analysis.append((edges[edge], completes, gives_away))
+        return analysis
 
     def make_move(self, x1, y1, x2, y2) -> tuple[bool, bool, int]:
         """x, y are column, row."""
         if x1 == x2 and y1 == y2:
-            logging.warning("Invalid move attempt with identical coordinates")
+            logger.warning("Invalid move attempt with identical coordinates")
             print("Invalid move; coordinates are identical.")
             return False, False, 0
         if (abs(x1 - x2) == 1 and y1 == y2) or \
                 (x1 == x2 and abs(y1 - y2) == 1):
-            if self.is_line_drawn(x1, y1, x2, y2):
-                logging.warning("Invalid move attempt on existing line")
+            edge = self.tables.edge_index.get((x1, y1, x2, y2))
+            if edge is None:
+                logger.warning("Invalid move attempt outside the board")
+                print("Invalid move; line is outside the board.")
+                return False, False, 0
+            if self.drawn >> edge & 1:
+                logger.warning("Invalid move attempt on existing line")
                 print("Invalid move; line already exists.")
                 return False, False, 0
             self.lines.append({
@@ -117,16 +218,14 @@ class Bases:
                 'x2': x2, 'y2': y2
             })
             self.turn_id += 1
-            logging.info(f"Player {self.turn} drew a line from \
-                         ({x1}, {y1}) to ({x2}, {y2})")
-            completed_box = any(
-                self.check_and_update_box(row, col)
-                for row in range(self.size)
-                for col in range(self.size)
-            )
-            return True, completed_box, self.is_potential_box(x1, y1, x2, y2)
+            logger.info("Player %s drew a line from (%d, %d) to (%d, %d)",
+                        self.turn, x1, y1, x2, y2)
+            completed = self.draw_edge(edge)
+            # The boxes closed by this line are exactly the ones
+            # `is_potential_box` would count after the move
+            return True, completed > 0, completed
         else:
-            logging.warning("Invalid move attempt with non-adjacent points")
+            logger.warning("Invalid move attempt with non-adjacent points")
             print("Invalid move: points must be adjacent",
                   "and form a straight line.")
             return False, False, 0
@@ -138,26 +237,12 @@ class Bases:
         ))
 
     def is_full(self) -> bool:
-        return len(self.lines) == 2 * self.size * (self.size + 1)
+        return self.drawn == self.tables.full_mask
 
     def save_lines_to_csv(self) -> None:
-        file_exists = False
-        try:
-            with open(bases.LINES_LOG_PATH, 'r'):
-                file_exists = True
-        except FileNotFoundError:
-            pass
-        with open(bases.LINES_LOG_PATH, 'a', newline='') as csvfile:
-            fieldnames = ['game_id',
-                          'turn_id',
-                          'player',
-                          'x1', 'y1', 'x2', 'y2']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-            for line in self.lines:
-                writer.writerow(line)
-        logging.info("Lines saved to %s", bases.LINES_LOG_PATH)
+        """Queue the game's moves on the buffered lines log (CSV unless
+        `lines_log_format` is binary, see `bases.logs`)."""
+        move_log().write_game(self.lines, self.size)
 
     def print_win_counts(self) -> None:
         print(f"Games won by A: {self.wins['A']}, B: {self.wins['B']}",
@@ -168,7 +253,7 @@ class Bases:
         self.reset()
         Bases.game_counter += 1
         self.game_id = Bases.game_counter
-        logging.info(f'Starting game {self.game_id}')
+        logger.info('Starting game %d', self.game_id)
         print("\nStarting new game...")
 
         self.print_win_counts()
@@ -181,19 +266,20 @@ class Bases:
                 # Determine the move: AI/Human
                 if self.turn == 'A':
                     move = player_a.choose_action(self)
-                    if isinstance(player_a, QLearningAgent):
+                    if not isinstance(player_a, HumanPlayer):
                         print(f"AI (Player A)'s turn: drawing line {move}")
                 else:
                     move = player_b.choose_action(self)
-                    if isinstance(player_b, QLearningAgent):
+                    if not isinstance(player_b, HumanPlayer):
                         print(f"AI (Player B)'s turn: drawing line {move}")
 
                 # Record state/action for learning agent
-                state = self.get_detailed_state()
-                if isinstance(player_a, QLearningAgent) and self.turn == 'A':
+                state = self.get_state_key()
+                if isinstance(player_a, LEARNING_AGENTS) and self.turn == 'A':
                     last_state = state
                     last_action = move
-                elif isinstance(player_b, QLearningAgent) and self.turn == 'B':
+                elif isinstance(player_b, LEARNING_AGENTS) and \
+                        self.turn == 'B':
                     last_state = state
                     last_action = move
 
@@ -207,13 +293,14 @@ class Bases:
                 if completed_box:
                     reward = 1
 
-                next_state = self.get_detailed_state()
+                next_state = self.get_state_key()
                 available_moves = self.available_moves()
 
-                if isinstance(player_a, QLearningAgent) and self.turn == 'A':
+                if isinstance(player_a, LEARNING_AGENTS) and self.turn == 'A':
                     player_a.update(last_state, last_action,
                                     reward, next_state, available_moves)
-                elif isinstance(player_b, QLearningAgent) and self.turn == 'B':
+                elif isinstance(player_b, LEARNING_AGENTS) and \
+                        self.turn == 'B':
                     player_b.update(last_state, last_action,
                                     reward, next_state, available_moves)
 
@@ -226,21 +313,93 @@ class Bases:
         finally:
             self.print_board()
             self.save_lines_to_csv()
-            print("Game progress saved to lines.csv.")
-
-        # Determine winner
-        if self.scores['A'] > self.scores['B']:
-            result = 'A'
-        elif self.scores['A'] < self.scores['B']:
-            result = 'B'
-        else:
-            result = 'Tie'
+            # Write out a person's game now rather than when the buffer fills
+            if isinstance(player_a, HumanPlayer) or \
+                    isinstance(player_b, HumanPlayer):
+                move_log().flush()
+                print(f"Game progress saved to {move_log().path}.")
 
+        result = self.get_winner()
         self.wins[result] += 1
+        for seat, player in (('A', player_a), ('B', player_b)):
+            if isinstance(player, LEARNING_AGENTS):
+                player.finish_episode(self.result_reward(result, seat))
         print(f"Game over. Result: {result}")
         self.print_win_counts()
         return result
 
+    def simulate(self, player_a, player_b) -> Literal['A', 'B', 'Tie']:
+        """
+        Headless `play`: no rendering, per-move logging or CSV output.
+        Learning agents are updated exactly as in `play`.
+        """
+        self.reset()
+        Bases.game_counter += 1
+        self.game_id = Bases.game_counter
+        players = {'A': player_a, 'B': player_b}
+        learning = {'A': isinstance(player_a, LEARNING_AGENTS),
+                    'B': isinstance(player_b, LEARNING_AGENTS)}
+        edge_index = self.tables.edge_index
+
+        while not self.is_full():
+            player = players[self.turn]
+            move = player.choose_action(self)
+            edge = edge_index.get(move)
+            if edge is None or self.drawn >> edge & 1:
+                continue
+            if learning[self.turn]:
+                state = self.get_state_key()
+
+            x1, y1, x2, y2 = move
+            self.lines.append({
+                'game_id': self.game_id,
+                'turn_id': self.turn_id,
+                'player': self.turn,
+                'x1': x1, 'y1': y1,
+                'x2': x2, 'y2': y2
+            })
+            self.turn_id += 1
+            completed = self.draw_edge(edge)
+
+            if learning[self.turn]:
+                player.update(state, move, 1 if completed else 0,
+                              self.get_state_key(),
+                              self.available_moves())
+
+            self.turn = 'B' if self.turn == 'A' else 'A'
+
+        result = self.get_winner()
+        self.wins[result] += 1
+        for seat, player in players.items():
+            if learning[seat]:
+                player.finish_episode(self.result_reward(result, seat))
+        return result
+
+    def get_winner(self) -> Literal['A', 'B', 'Tie']:
+        if self.scores['A'] > self.scores['B']:
+            return 'A'
+        elif self.scores['A'] < self.scores['B']:
+            return 'B'
+        return 'Tie'
+
+    @staticmethod
+    def result_reward(result: str, player: str) -> int:
+        """1 for a win, -1 for a loss and 0 for a tie of `player`."""
+        if result == 'Tie':
+            return 0
+        return 1 if result == player else -1
+
+    def ai_agent(self):
+        """The AI opponent: a client of the `policy_server` setting if it
+        is set (see `bases.serve`), else the policy at POLICY_PATH."""
+        address = bases.cfg.get('policy_server')
+        if address:
+            from .serve import RemoteAgent
+            return RemoteAgent(address)
+        agent = QLearningAgent(self.size, training_mode=False)
+        agent.load_policy(bases.POLICY_PATH)
+        return agent
+
     def game_loop(self) -> None:
         """Game mode selection."""
         print("Select game mode:")
@@ -255,14 +414,12 @@ class Bases:
                 result = self.play(HumanPlayer(), HumanPlayer())
                 print(f"Game over. Result: {result}")
         elif choice == 2:
-            agent = QLearningAgent(self.size, training_mode=False)
-            agent.load_policy(bases.POLICY_PATH)
+            agent = self.ai_agent()
             while True:
                 result = self.play(HumanPlayer(), agent)  # human_player='A'
                 print(f"Game over. Result: {result}")
         elif choice == 3:
-            agent = QLearningAgent(self.size, training_mode=False)
-            agent.load_policy(bases.POLICY_PATH)
+            agent = self.ai_agent()
             while True:
                 result = self.play(agent, HumanPlayer())  # human_player='B'
                 print(f"Game over. Result: {result}")
@@ -270,34 +427,24 @@ class Bases:
             print("Invalid choice, exiting game loop.")
 
     def is_potential_box(self, x1, y1, x2, y2) -> int:
+        """Number of closed boxes adjacent to the line."""
+        edge = self.tables.edge_index.get((x1, y1, x2, y2))
+        if edge is None:
+            return 0
         potential_boxes = 0
-        # Is it a vertical line? (col stays constant, row changes)
-        if x1 == x2:
-            col = x1
-            for row in [y1 - 1, y1]:
-                if 0 <= row < self.size:
-                    if (
-                        self.is_line_drawn(col, row, col + 1, row)
-                        and self.is_line_drawn(col, row + 1, col + 1, row + 1)
-                        and self.is_line_drawn(col, row, col, row + 1)
-                        and self.is_line_drawn(col + 1, row, col + 1, row + 1)
-                    ):
-                        potential_boxes += 1
-
-        # Is it a horizontal line? (row stays constant, col changes)
-        if y1 == y2:
-            row = y1
-            for col in [x1 - 1, x1]:
-                if 0 <= col < self.size:
-                    if (
-                        self.is_line_drawn(col, row, col + 1, row)
-                        and self.is_line_drawn(col, row + 1, col + 1, row + 1)
-                        and self.is_line_drawn(col, row, col, row + 1)
-                        and self.is_line_drawn(col + 1, row, col + 1, row + 1)
-                    ):
-                        potential_boxes += 1
+        for box in self.tables.edge_boxes[edge]:
+            mask = self.tables.box_masks[box]
+            if self.drawn & mask == mask:
+                potential_boxes += 1
         return potential_boxes
 
+    def get_state_key(self) -> int:
+        """
+        Integer form of `get_detailed_state`: the drawn edge bitmask with
+        box owners packed two bits per box above it.
+        """
+        return self.drawn | self.owner_bits << self.tables.num_edges
+
     def get_detailed_state(self):
         """
         State is:
@@ -0,0 +1,308 @@
+import cProfile
+import functools
+import json
+import math
+import os
+import time
+import weakref
+from .agent import QLearningAgent
+from .game import Bases
+
+# Timed phases: (class, method). Phases nest, e.g. choose_action includes
+# the canonicalization it triggers, so times are inclusive.
+PHASES = {
+    'choose_action': (QLearningAgent, 'choose_action'),
+    'canonicalize': (QLearningAgent, 'canonical_state'),
+    'update': (QLearningAgent, 'update'),
+    'update_batch': (QLearningAgent, 'update_batch'),
+    'finish_episode': (QLearningAgent, 'finish_episode'),
+    'make_move': (Bases, 'make_move'),
+    'draw_edge': (Bases, 'draw_edge'),
+    'available_moves': (Bases, 'available_moves'),
+    'render': (Bases, 'print_board'),
+    'csv_output': (Bases, 'save_lines_to_csv'),
+}
+# Histogram buckets per doubling of the duration, for percentiles
+BUCKETS_PER_OCTAVE = 4
+
+_active = None
+
+
+def active():
+    """The enabled `Instrumentation`, or None."""
+    return _active
+
+
+def start_worker(settings: dict | None) -> 'Instrumentation | None':
+    """
+    In a worker process, enable an `Instrumentation` from the parent's
+    `worker_settings`, or None. One inherited from a forked parent is
+    disabled first, so nothing is measured twice.
+    """
+    if _active is not None:
+        _active.disable()
+    if settings is None:
+        return None
+    instrumentation = Instrumentation(**settings)
+    instrumentation.enable()
+    return instrumentation
+
+
+class Timer:
+    """Call count, total time and a log-scale histogram of durations."""
+    __slots__ = ('calls', 'total', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.histogram = {}
+
+    def add(self, nanoseconds: int) -> None:
+        self.calls += 1
+        self.total += nanoseconds
+        bucket = int(math.log2(nanoseconds + 1) * BUCKETS_PER_OCTAVE)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        """Approximate duration in microseconds below which `fraction`
+        of the calls fall."""
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= fraction * self.calls:
+                return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1000
+        return 0.0
+
+    def merge(self, other: 'Timer') -> None:
+        self.calls += other.calls
+        self.total += other.total
+        for bucket, count in other.histogram.items():
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + count
+
+    def summary(self) -> dict:
+        return {'calls': self.calls, 'total_s': self.total / 1e9,
+                'mean_us': self.total / max(self.calls, 1) / 1000,
+                'p50_us': self.percentile(0.5),
+                'p90_us': self.percentile(0.9),
+                'p99_us': self.percentile(0.99)}
+
+
+class Instrumentation:
+    """
+    Per-phase timers and counters for `Bases` and `QLearningAgent`.
+
+    Nothing is measured until `enable` (or a `with` block): the methods
+    in `PHASES` are then wrapped with timers, and restored by `disable`,
+    so there is no cost while it is off. Q-table lookups of the agent's
+    own states in `choose_action` (when it canonicalized the position)
+    and `update` are counted as hits or misses.
+
+    Training loops call `episode` after each game. Every
+    `summary_every` episodes a summary is printed and, with `json_path`,
+    written as JSON. With `profile_every`, one episode in that many runs
+    under cProfile and its stats are saved in `profile_dir`.
+
+    Worker processes measure with their own instance (`worker_settings`)
+    and send what they `take` to `merge`, which counts their episodes
+    towards the summaries.
+    """
+
+    def __init__(self, summary_every: int | None = None,
+                 json_path=None, profile_every: int | None = None,
+                 profile_dir='data/profile'):
+        self.summary_every = summary_every
+        self.json_path = json_path
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self.timers = {phase: Timer() for phase in PHASES}
+        self.counters = {'episodes': 0, 'q_hits': 0, 'q_misses': 0}
+        self.agents = weakref.WeakSet()
+        self.started = None
+        self._originals = {}
+        self._profiler = None
+        self._taken_episodes = 0
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> 'Instrumentation | None':
+        """From the `instrumentation` setting, or None if it is off."""
+        settings = cfg.get('instrumentation') or {}
+        if not any(settings.get(key) for key in
+                   ('summary_every', 'json_path', 'profile_every')):
+            return None
+        return cls(settings.get('summary_every'), settings.get('json_path'),
+                   settings.get('profile_every'),
+                   settings.get('profile_dir', 'data/profile'))
+
+    def enable(self) -> None:
+        global _active
+        if _active is not None:
+            raise RuntimeError("Instrumentation is already enabled")
+        for phase, (owner, name) in PHASES.items():
+            self._originals[phase] = owner.__dict__[name]
+        for phase, (owner, name) in PHASES.items():
+            setattr(owner, name, self._wrap(phase, self._originals[phase]))
+        learn = QLearningAgent._learn
+        self._originals['_learn'] = learn
+        QLearningAgent._learn = self._wrap_learn(learn)
+        self.started = time.perf_counter()
+        _active = self
+
+    def disable(self) -> None:
+        global _active
+        if _active is not self:
+            return
+        self._stop_profile()
+        for phase, (owner, name) in PHASES.items():
+            setattr(owner, name, self._originals[phase])
+        QLearningAgent._learn = self._originals['_learn']
+        self._originals = {}
+        _active = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+        if self.json_path:
+            self.export_json(self.json_path)
+
+    def _wrap(self, phase: str, function):
+        timer = self.timers[phase]
+        clock = time.perf_counter_ns
+        counters, agents = self.counters, self.agents
+
+        if phase == 'choose_action':
+            @functools.wraps(function)
+            def timed(agent, game):
+                start = clock()
+                try:
+                    return function(agent, game)
+                finally:
+                    timer.add(clock() - start)
+                    # The lookup is counted after the call from the
+                    # canonical key it left in the agent's cache
+                    key, canonical = agent._last_canonical
+                    if key is not None and key == game.get_state_key():
+                        counters['q_hits' if canonical[0] in agent.q_table
+                                 else 'q_misses'] += 1
+                    agents.add(agent)
+            return timed
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timer.add(clock() - start)
+        return timed
+
+    def _wrap_learn(self, function):
+        counters, agents = self.counters, self.agents
+
+        @functools.wraps(function)
+        def counted(agent, previous_state, edge, reward, next_state,
+                    next_edges):
+            counters['q_hits' if previous_state in agent.q_table
+                     else 'q_misses'] += 1
+            agents.add(agent)
+            return function(agent, previous_state, edge, reward,
+                            next_state, next_edges)
+        return counted
+
+    def episode(self) -> None:
+        """Count a finished episode; print, export and profile as set."""
+        self.counters['episodes'] += 1
+        episodes = self.counters['episodes']
+        if self._profiler is not None:
+            self._stop_profile()
+        if self.profile_every and episodes % self.profile_every == 0:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._maybe_report(episodes - 1)
+
+    def _maybe_report(self, before: int) -> None:
+        """Print and export a summary if the episode count passed a
+        multiple of `summary_every` since `before`."""
+        every = self.summary_every
+        if every and self.counters['episodes'] // every > before // every:
+            self.print_summary()
+            if self.json_path:
+                self.export_json(self.json_path)
+
+    def worker_settings(self, name: str) -> dict:
+        """Arguments of the `Instrumentation` of a worker process: no
+        output of its own, profiles in `profile_dir`/<name>."""
+        return {'profile_every': self.profile_every,
+                'profile_dir': os.path.join(self.profile_dir, name)}
+
+    def take(self) -> tuple[dict, dict]:
+        """The timers and counters since the last call, which are then
+        reset (the episode count keeps running for `profile_every`); a
+        worker sends them to the parent's `merge`."""
+        timers = {}
+        for phase, timer in self.timers.items():
+            timers[phase] = copy = Timer()
+            copy.calls, copy.total, copy.histogram = \
+                timer.calls, timer.total, timer.histogram
+            timer.calls, timer.total, timer.histogram = 0, 0, {}
+        counters = dict(self.counters)
+        counters['episodes'] -= self._taken_episodes
+        self._taken_episodes = self.counters['episodes']
+        for name in self.counters:
+            if name != 'episodes':
+                self.counters[name] = 0
+        return timers, counters
+
+    def merge(self, timers: dict, counters: dict) -> None:
+        """Add measurements `take`n in a worker process, printing and
+        exporting a summary as `episode` would."""
+        before = self.counters['episodes']
+        for phase, timer in timers.items():
+            self.timers[phase].merge(timer)
+        for name, value in counters.items():
+            self.counters[name] += value
+        self._maybe_report(before)
+
+    def _stop_profile(self) -> None:
+        if self._profiler is None:
+            return
+        self._profiler.disable()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self._profiler.dump_stats(os.path.join(
+            self.profile_dir,
+            f"episode_{self.counters['episodes']}.prof"))
+        self._profiler = None
+
+    def summary(self) -> dict:
+        lookups = self.counters['q_hits'] + self.counters['q_misses']
+        elapsed = 0.0 if self.started is None else \
+            time.perf_counter() - self.started
+        return {
+            'elapsed_s': elapsed,
+            'counters': dict(self.counters),
+            'q_hit_rate': self.counters['q_hits'] / max(lookups, 1),
+            'q_table_states': sum(len(agent.q_table)
+                                  for agent in self.agents),
+            'phases': {phase: timer.summary()
+                       for phase, timer in self.timers.items()
+                       if timer.calls},
+        }
+
+    def print_summary(self) -> None:
+        report = self.summary()
+        print(f"--- {report['counters']['episodes']} episodes,",
+              f"{report['elapsed_s']:.1f}s, Q-table",
+              f"{report['q_table_states']} states, hit rate",
+              f"{report['q_hit_rate']:.1%} ---")
+        for phase, timer in sorted(report['phases'].items(),
+                                   key=lambda item: -item[1]['total_s']):
+            print(f"{phase:<16} {timer['calls']:>10} calls",
+                  f"{timer['total_s']:>8.2f}s",
+                  f"p50 {timer['p50_us']:>8.1f}us",
+                  f"p99 {timer['p99_us']:>8.1f}us")
+
+    def export_json(self, path) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
@@ -0,0 +1,221 @@
+import random
+import numpy as np
+from .board import board_tables
+from .config import ensure_parent
+
+FEATURES = ('bias', 'border', 'adjacent_0', 'adjacent_1', 'gives_away',
+            'completes', 'sacrifice_chain', 'capture_chain',
+            'gives_away_no_safe', 'completes_no_safe', 'safe_parity',
+            'safe_moves', 'long_chains', 'score_margin', 'drawn')
+
+
+class LinearQAgent:
+    """
+    Q-learning with a linear function of move features instead of a table.
+
+    Each (state, move) is described by the fixed-size vector `FEATURES`:
+    how many sides the boxes next to the move already have (so whether
+    it completes a box or gives one away), the length of the chain it
+    sacrifices or starts to capture, and position statistics such as the
+    number and parity of safe moves left, long chains and the score. All
+    moves of a position are scored with one matrix product, so memory
+    does not grow with the number of states seen and what is learned in
+    one position carries over to similar ones on any board size.
+
+    Q(s, a) estimates the box margin the move gains for the player to
+    move. The turn alternates after every move, so the target of a move
+    is its reward minus the best value of the opponent's reply. Updates
+    are applied in mini-batches of `batch_size` moves.
+    """
+
+    def __init__(self, grid_size: int, learning_rate: float = 0.01,
+                 discount_factor: float = 1.0, exploration_rate: float = 0.1,
+                 training_mode: bool = True, batch_size: int = 32):
+        self.grid_size = grid_size
+        self.learning_rate = learning_rate
+        self.discount_factor = discount_factor
+        self.exploration_rate = exploration_rate
+        self.training_mode = training_mode
+        self.batch_size = batch_size
+        self.tables = tables = board_tables(grid_size)
+        self.weights = np.zeros(len(FEATURES), dtype=np.float32)
+        # (features of the move, reward, next_state) waiting for a batch
+        self.pending = []
+
+        self._edge_boxes = np.zeros((tables.num_edges, tables.num_boxes),
+                                    dtype=np.float32)
+        for edge, boxes in enumerate(tables.edge_boxes):
+            self._edge_boxes[edge, boxes] = 1
+        self._box_edges = np.ascontiguousarray(self._edge_boxes.T)
+        self._border = (self._edge_boxes.sum(axis=1) == 1).astype(np.float32)
+        # Edges between two boxes, which join them into chains
+        self._links = [(edge, *boxes)
+                       for edge, boxes in enumerate(tables.edge_boxes)
+                       if len(boxes) == 2]
+        self._key_bytes = (tables.num_edges + 7) // 8
+        # One-hot of a box's side count (4 = closed, all zero)
+        self._valence = np.eye(5, 4, dtype=np.float32)
+        # Low bit of each box's 2-bit owner code in a state key
+        self._owner_mask = sum(1 << 2 * box
+                               for box in range(tables.num_boxes))
+        self._last_features = (None, None)
+
+    def _drawn_vector(self, drawn: int) -> np.ndarray:
+        bits = np.frombuffer(drawn.to_bytes(self._key_bytes, 'little'),
+                             dtype=np.uint8)
+        return np.unpackbits(bits, bitorder='little')[:self.tables.num_edges]
+
+    def _chain_lengths(self, drawn: int, sides: np.ndarray) -> np.ndarray:
+        """Boxes in the chain of each box with 2 or 3 sides (0 for the
+        rest); chains are joined through undrawn shared edges."""
+        parent = list(range(self.tables.num_boxes))
+
+        def find(box):
+            while parent[box] != box:
+                parent[box] = parent[parent[box]]
+                box = parent[box]
+            return box
+
+        in_chain = (sides == 2) | (sides == 3)
+        linked = in_chain.tolist()
+        for edge, first, second in self._links:
+            if not drawn >> edge & 1 and linked[first] and linked[second]:
+                parent[find(first)] = find(second)
+        roots = [find(box) for box in range(self.tables.num_boxes)]
+        sizes = np.bincount(roots, weights=in_chain,
+                            minlength=self.tables.num_boxes)
+        return (sizes[roots] * in_chain).astype(np.int64)
+
+    def features(self, state: int) -> np.ndarray:
+        """(num_edges, len(FEATURES)) features of every edge in the
+        position of integer state key `state`; the last one is cached."""
+        if self._last_features[0] == state:
+            return self._last_features[1]
+        tables = self.tables
+        num_boxes = tables.num_boxes
+        drawn = state & tables.full_mask
+        drawn_count = drawn.bit_count()
+        free = 1 - self._drawn_vector(drawn).astype(np.float32)
+        sides = (self._box_edges @ (1 - free)).astype(np.int64)
+        adjacent = self._edge_boxes @ self._valence[sides]
+        gives_away, completes = adjacent[:, 2], adjacent[:, 3]
+        chains = self._chain_lengths(drawn, sides)
+        safe_moves = int(free @ (gives_away + completes == 0))
+
+        # Score of the player to move (A when an even number is drawn)
+        owners = state >> tables.num_edges
+        margin = (owners & ~owners >> 1 & self._owner_mask).bit_count() - \
+            (owners >> 1 & ~owners & self._owner_mask).bit_count()
+        if drawn_count % 2:
+            margin = -margin
+
+        features = np.empty((tables.num_edges, len(FEATURES)),
+                            dtype=np.float32)
+        features[:, 0] = 1
+        features[:, 1] = self._border
+        features[:, 2:6] = adjacent[:, :4]
+        features[:, 6] = (self._edge_boxes *
+                          (chains * (sides == 2))).max(axis=1) / num_boxes
+        features[:, 7] = (self._edge_boxes *
+                          (chains * (sides == 3))).max(axis=1) / num_boxes
+        features[:, 8] = gives_away * (safe_moves == 0)
+        features[:, 9] = completes * (safe_moves == 0)
+        features[:, 10:] = (
+            1 if safe_moves % 2 else -1, safe_moves / tables.num_edges,
+            np.count_nonzero(np.bincount(chains)[3:]) / num_boxes,
+            margin / num_boxes, drawn_count / tables.num_edges)
+        features *= free[:, None]
+        self._last_features = (state, features)
+        return features
+
+    def q_values(self, state: int) -> np.ndarray:
+        """Q-value of every edge (-inf for drawn ones)."""
+        values = self.features(state) @ self.weights
+        drawn = self._drawn_vector(state & self.tables.full_mask)
+        values[drawn.astype(bool)] = -np.inf
+        return values
+
+    def choose_action(self, game) -> tuple[int, int, int, int]:
+        if self.training_mode and random.random() < self.exploration_rate:
+            return random.choice(game.available_moves())
+        values = self.q_values(game.get_state_key())
+        best = np.flatnonzero(values == values.max())
+        return self.tables.edges[random.choice(best.tolist())]
+
+    def choose_actions(self, batch) -> np.ndarray:
+        """Greedy (epsilon-greedy in training) edge ids for every game of
+        a `BatchBases`."""
+        legal = batch.legal_moves()
+        actions = np.zeros(batch.num_games, dtype=np.int64)
+        for game in np.flatnonzero(legal.any(axis=1)):
+            values = self.q_values(batch.get_state_key(game))
+            actions[game] = random.choice(
+                np.flatnonzero(values == values.max()).tolist())
+        if self.training_mode:
+            for game in np.flatnonzero(np.random.random(batch.num_games) <
+                                       self.exploration_rate):
+                if legal[game].any():
+                    actions[game] = random.choice(
+                        np.flatnonzero(legal[game]).tolist())
+        return actions
+
+    def update(self, previous_state: int, action, reward: float,
+               next_state: int, available_moves) -> None:
+        """Queue one move (`action` is a line tuple); states are integer
+        state keys. The moves left are read from `next_state`."""
+        self.update_batch([(previous_state, self.tables.edge_index[action],
+                            reward, next_state)])
+
+    def update_batch(self, transitions) -> None:
+        """Queue (state, edge, reward, next_state) transitions, learning
+        them `batch_size` at a time. The latest one is held back until
+        more arrive or `finish_episode`, so the result can be added."""
+        for state, edge, reward, next_state in transitions:
+            if len(self.pending) > self.batch_size:
+                self._learn(self.pending[:-1])
+                self.pending = self.pending[-1:]
+            # Usually cached by the `choose_action` that picked the move
+            self.pending.append((self.features(state)[edge], reward,
+                                 next_state))
+
+    def finish_episode(self, reward: float = 0) -> None:
+        """Add the game result to the last queued move and learn every
+        queued move."""
+        if not self.pending:
+            return
+        row, last_reward, next_state = self.pending[-1]
+        self.pending[-1] = (row, last_reward + reward, next_state)
+        pending, self.pending = self.pending, []
+        self._learn(pending)
+
+    def enhance_reward(self, completed_box, potential_box_opponent) -> float:
+        """Reward of a replayed move: the box it completes; giving one
+        away is already priced in by the opponent's reply."""
+        return 1.0 if completed_box else 0.0
+
+    def _learn(self, transitions) -> None:
+        """One gradient step of the squared TD error over `transitions`."""
+        full_mask = self.tables.full_mask
+        rows, targets = [], []
+        for row, reward, next_state in transitions:
+            rows.append(row)
+            future = 0.0
+            if next_state & full_mask != full_mask:
+                future = float(self.q_values(next_state).max())
+            targets.append(reward - self.discount_factor * future)
+        rows = np.array(rows)
+        errors = np.array(targets, dtype=np.float32) - rows @ self.weights
+        self.weights += self.learning_rate * (errors @ rows) / len(rows)
+
+    def save_policy(self, file_path) -> None:
+        """Weights as .npy (the feature list is fixed by `FEATURES`)."""
+        ensure_parent(file_path)
+        with open(file_path, 'wb') as f:
+            np.save(f, self.weights)
+
+    def load_policy(self, file_path) -> None:
+        weights = np.load(file_path)
+        if weights.shape != self.weights.shape:
+            raise ValueError(f"{file_path} has {weights.size} weights, "
+                             f"not {self.weights.size}")
+        self.weights = weights.astype(np.float32)
@@ -0,0 +1,226 @@
+import bases
+import atexit
+import csv
+import logging
+import logging.handlers
+import os
+import queue
+import struct
+from .board import board_tables
+from .config import ensure_parent
+
+logger = logging.getLogger('bases')
+
+# Level of game.log per run mode of play.py
+LOG_LEVELS = {'play': 'DEBUG', 'train': 'WARNING', 'tune': 'WARNING'}
+FIELDNAMES = ['game_id', 'turn_id', 'player', 'x1', 'y1', 'x2', 'y2']
+
+# Binary move log: file header, then per game a record header followed by
+# the edge id of each move (players alternate starting with A): one byte
+# each, or two little-endian bytes on boards with more than 256 edges
+FILE_HEADER = struct.Struct('<4sH')
+MAGIC = b'BMOV'
+VERSION = 1
+RECORD = struct.Struct('<IBH')  # game id, grid size, moves
+
+_listener = None
+_move_log = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted; the listener thread formats them."""
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(mode: str | None = None, path=None) -> None:
+    """
+    Send the 'bases' logger to game.log (or `path`) through a queue, so
+    records are formatted and written by a background thread. The level
+    comes from the `log_levels` setting for `mode` (see `LOG_LEVELS`).
+    The first call opens the log; later calls only change the level.
+    """
+    global _listener
+    if _listener is not None and mode is None:
+        return
+    levels = {**LOG_LEVELS, **bases.cfg.get('log_levels', {})}
+    logger.setLevel(levels[mode or 'play'])
+    if _listener is not None:
+        return
+
+    path = path or bases.cfg['game_log']
+    ensure_parent(path)
+    handler = logging.FileHandler(path, mode='w')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s',
+                                           '%Y-%m-%d %H:%M:%S'))
+    records = queue.SimpleQueue()
+    logger.addHandler(_QueueHandler(records))
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class MoveLogWriter:
+    """
+    Buffered writer of finished games. Games are kept in memory and
+    written `buffer_games` at a time, as lines.csv rows (`fmt='csv'`) or
+    compact binary records (`fmt='binary'`). With `max_bytes` the file
+    is rotated like `logging.handlers.RotatingFileHandler`: path.1 is
+    the newest backup and at most `backups` are kept.
+    """
+
+    def __init__(self, path, fmt: str = 'csv', buffer_games: int = 100,
+                 max_bytes: int = 0, backups: int = 5):
+        if fmt not in ('csv', 'binary'):
+            raise ValueError(f"Unknown move log format '{fmt}'")
+        self.path = str(path)
+        self.fmt = fmt
+        self.buffer_games = buffer_games
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.games = []
+
+    def write_game(self, lines: list[dict], size: int) -> None:
+        """Queue one game's move records (`Bases.lines`) on a board of
+        `size` boxes per side."""
+        if lines:
+            self.games.append((size, list(lines)))
+        if len(self.games) >= self.buffer_games:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.games:
+            return
+        games, self.games = self.games, []
+        ensure_parent(self.path)
+        if self.max_bytes and os.path.exists(self.path) and \
+                os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        new_file = not os.path.exists(self.path) or \
+            os.path.getsize(self.path) == 0
+        if self.fmt == 'csv':
+            with open(self.path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(line for _, lines in games
+                                 for line in lines)
+        else:
+            chunks = [FILE_HEADER.pack(MAGIC, VERSION)] if new_file else []
+            for size, lines in games:
+                chunks.append(self._encode(lines, size))
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(chunks))
+        logger.info("%d games saved to %s", len(games), self.path)
+
+    def _encode(self, lines: list[dict], size: int) -> bytes:
+        tables = board_tables(size)
+        edges = [tables.edge_index[(line['x1'], line['y1'],
+                                    line['x2'], line['y2'])]
+                 for line in lines]
+        if size > 0xFF or len(edges) > 0xFFFF:
+            raise ValueError(f"A {size}x{size} game of {len(edges)} moves "
+                             "does not fit a binary move log record")
+        return RECORD.pack(lines[0]['game_id'] or 0, size, len(edges)) + \
+            struct.pack(f'<{len(edges)}{_edge_format(tables)}', *edges)
+
+    def _rotate(self) -> None:
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self) -> None:
+        self.flush()
+
+
+def move_log() -> MoveLogWriter:
+    """Process-wide writer for the configured lines log, flushed at exit."""
+    global _move_log
+    if _move_log is None:
+        cfg = bases.cfg
+        _move_log = MoveLogWriter(cfg['lines_log'],
+                                  cfg.get('lines_log_format', 'csv'),
+                                  cfg.get('lines_log_buffer', 100),
+                                  cfg.get('lines_log_max_bytes', 0),
+                                  cfg.get('lines_log_backups', 5))
+        atexit.register(_move_log.close)
+    return _move_log
+
+
+def set_move_log(writer: MoveLogWriter | None) -> MoveLogWriter | None:
+    """Replace the process-wide writer (None reopens the configured one
+    on next use); returns the previous writer, flushed."""
+    global _move_log
+    previous, _move_log = _move_log, writer
+    if previous is not None:
+        previous.flush()
+    return previous
+
+
+def _edge_format(tables) -> str:
+    """struct code of one edge id in a binary move log record."""
+    return 'B' if tables.num_edges <= 0x100 else 'H'
+
+
+def is_binary_move_log(path) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_move_log(path):
+    """
+    Move records of a CSV or binary move log as lines.csv row dicts,
+    streamed one game at a time.
+    """
+    if not is_binary_move_log(path):
+        with open(path, 'r', newline='') as f:
+            yield from csv.DictReader(f)
+        return
+    with open(path, 'rb') as f:
+        magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} move log")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            game_id, size, count = RECORD.unpack(header)
+            tables = board_tables(size)
+            edges = tables.edges
+            moves = struct.Struct(f'<{count}{_edge_format(tables)}')
+            for turn, edge in enumerate(moves.unpack(f.read(moves.size))):
+                x1, y1, x2, y2 = edges[edge]
+                yield {'game_id': game_id, 'turn_id': turn + 1,
+                       'player': 'B' if turn % 2 else 'A',
+                       'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
+
+
+def export_csv(path, csv_path) -> int:
+    """Write any move log as lines.csv; returns the number of rows."""
+    rows = 0
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for row in read_move_log(path):
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert a binary move log to lines.csv.")
+    parser.add_argument('path')
+    parser.add_argument('csv_path')
+    args = parser.parse_args()
+    print(f"Wrote {export_csv(args.path, args.csv_path)} moves to",
+          args.csv_path)
@@ -0,0 +1,250 @@
+import math
+import multiprocessing as mp
+import random
+import time
+from .board import board_tables
+
+
+class Node:
+    """Position reached by playing `edge`; `wins` are counted for the
+    player who played it."""
+    __slots__ = ('drawn', 'edge', 'gain', 'children', 'untried',
+                 'visits', 'wins')
+
+    def __init__(self, drawn: int, edge: int, gain: int, untried: list):
+        self.drawn = drawn
+        self.edge = edge
+        self.gain = gain
+        self.children = {}
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0
+
+
+class MCTSTree:
+    """
+    UCT search tree over compact board states (drawn-edge masks). The
+    subtree under the position actually reached is kept between calls.
+    """
+
+    def __init__(self, size: int, exploration: float = 1.4,
+                 seed: int | None = None):
+        self.tables = board_tables(size)
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.root = None
+
+    def _free_edges(self, drawn: int) -> list[int]:
+        """Undrawn edges in random order."""
+        free = self.tables.full_mask & ~drawn
+        edges = []
+        while free:
+            low = free & -free
+            edges.append(low.bit_length() - 1)
+            free ^= low
+        self.rng.shuffle(edges)
+        return edges
+
+    def set_root(self, drawn: int) -> None:
+        """Reuse the node for `drawn` among the root's children or
+        grandchildren (our move and the reply), else start a new tree."""
+        root = self.root
+        if root is not None and root.drawn != drawn:
+            reused = None
+            for child in root.children.values():
+                if child.drawn == drawn:
+                    reused = child
+                    break
+                if child.drawn & ~drawn == 0:
+                    for grandchild in child.children.values():
+                        if grandchild.drawn == drawn:
+                            reused = grandchild
+                            break
+                if reused is not None:
+                    break
+            root = reused
+        if root is None:
+            root = Node(drawn, -1, 0, self._free_edges(drawn))
+        self.root = root
+
+    def search(self, drawn: int, margin: int, playouts: int | None,
+               deadline: float | None) -> tuple[list, int]:
+        """
+        Run playouts from `drawn`, where the player to move leads by
+        `margin` boxes, until `playouts` or `deadline` is reached.
+        Returns ([(edge, visits, wins) per root child], playouts run).
+        """
+        self.set_root(drawn)
+        root = self.root
+        tables = self.tables
+        completed_boxes = tables.completed_boxes
+        exploration = self.exploration
+        count = 0
+
+        while (playouts is None or count < playouts) and \
+                (deadline is None or count & 63 or
+                 time.perf_counter() < deadline):
+            count += 1
+            node, path = root, [root]
+            diff, sign = 0, 1  # box differential for the root player
+
+            # Selection
+            while not node.untried and node.children:
+                log_visits = math.log(node.visits)
+                node = max(node.children.values(),
+                           key=lambda child: child.wins / child.visits +
+                           exploration * math.sqrt(log_visits /
+                                                   child.visits))
+                diff += sign * node.gain
+                sign = -sign
+                path.append(node)
+
+            # Expansion
+            if node.untried:
+                edge = node.untried.pop()
+                gain = completed_boxes(node.drawn, edge)
+                child_drawn = node.drawn | 1 << edge
+                child = Node(child_drawn, edge, gain,
+                             self._free_edges(child_drawn))
+                node.children[edge] = child
+                diff += sign * gain
+                sign = -sign
+                node = child
+                path.append(node)
+
+            # Random rollout: a random order of the remaining edges
+            drawn_mask = node.drawn
+            for edge in self._free_edges(drawn_mask):
+                diff += sign * completed_boxes(drawn_mask, edge)
+                drawn_mask |= 1 << edge
+                sign = -sign
+
+            total = margin + diff
+            result = 1.0 if total > 0 else 0.0 if total < 0 else 0.5
+
+            # Backpropagation; odd depths were played by the root player
+            for depth, visited in enumerate(path):
+                visited.visits += 1
+                visited.wins += result if depth % 2 else 1.0 - result
+
+        stats = [(edge, child.visits, child.wins)
+                 for edge, child in root.children.items()]
+        return stats, count
+
+
+def _mcts_worker(conn, size: int, exploration: float,
+                 seed: int | None) -> None:
+    """Root-parallel worker: keeps its own tree and answers searches."""
+    tree = MCTSTree(size, exploration, seed)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        drawn, margin, playouts, time_limit = message
+        deadline = None if time_limit is None else \
+            time.perf_counter() + time_limit
+        conn.send(tree.search(drawn, margin, playouts, deadline))
+    conn.close()
+
+
+class MCTSAgent:
+    """
+    Monte Carlo Tree Search (UCT) agent with random rollouts.
+
+    Each move runs `playouts` playouts, or as many as fit in `time_limit`
+    seconds. The subtree under the position reached is reused on the next
+    move. With `workers` > 1, each of that many processes searches its own
+    tree from the same root (root parallelization) for the full budget and
+    the move with the most visits summed over all trees is played.
+    `playouts_per_second` reports the rate of the last move.
+    """
+
+    def __init__(self, playouts: int | None = 2000,
+                 time_limit: float | None = None, exploration: float = 1.4,
+                 workers: int = 1, seed: int | None = None):
+        if playouts is None and time_limit is None:
+            raise ValueError("MCTSAgent needs a playout or time budget")
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.workers = workers
+        self.seed = seed
+        self.size = None
+        self.tree = None
+        self._pipes = []
+        self._processes = []
+        self.last_playouts = 0
+        self.playouts_per_second = 0.0
+
+    def _start(self, size: int) -> None:
+        self.close()
+        self.size = size
+        if self.workers > 1:
+            for worker in range(self.workers):
+                parent, child = mp.Pipe()
+                seed = None if self.seed is None else self.seed + worker
+                process = mp.Process(target=_mcts_worker,
+                                     args=(child, size, self.exploration,
+                                           seed),
+                                     daemon=True)
+                process.start()
+                self._pipes.append(parent)
+                self._processes.append(process)
+        else:
+            self.tree = MCTSTree(size, self.exploration, self.seed)
+
+    def close(self) -> None:
+        """Stop worker processes."""
+        for conn in self._pipes:
+            conn.send(None)
+        for process in self._processes:
+            process.join()
+        self._pipes, self._processes = [], []
+        self.size = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def choose_action(self, game) -> tuple[int, int, int, int]:
+        if self.size != game.size:
+            self._start(game.size)
+        other = 'B' if game.turn == 'A' else 'A'
+        margin = game.scores[game.turn] - game.scores[other]
+
+        start = time.perf_counter()
+        if self._pipes:
+            for conn in self._pipes:
+                conn.send((game.drawn, margin, self.playouts,
+                           self.time_limit))
+            replies = [conn.recv() for conn in self._pipes]
+        else:
+            deadline = None if self.time_limit is None else \
+                start + self.time_limit
+            replies = [self.tree.search(game.drawn, margin, self.playouts,
+                                        deadline)]
+        elapsed = time.perf_counter() - start
+
+        visits = {}
+        for stats, _ in replies:
+            for edge, edge_visits, _ in stats:
+                visits[edge] = visits.get(edge, 0) + edge_visits
+        self.last_playouts = sum(count for _, count in replies)
+        self.playouts_per_second = self.last_playouts / max(elapsed, 1e-9)
+        edge = max(visits, key=visits.get)
+        return game.tables.edges[edge]
+
+
+def measure_playout_rate(grid_size: int, seconds: float = 1.0,
+                         workers: int = 1) -> float:
+    """Playouts per second of an `MCTSAgent` from the empty board."""
+    from .game import Bases
+
+    agent = MCTSAgent(playouts=None, time_limit=seconds, workers=workers)
+    agent.choose_action(Bases(grid_size))
+    agent.close()
+    print(f"{grid_size}x{grid_size}: {agent.playouts_per_second:.0f}",
+          f"playouts/s with {workers} worker(s)")
+    return agent.playouts_per_second
@@ -0,0 +1,155 @@
+import bases
+import itertools
+import time
+from .agent import QLearningAgent, OWNER_CODES
+from .board import board_tables
+from .logs import read_move_log
+
+# Terminal reward for player A; B gets the negation
+RESULT_REWARDS = {'A': 1, 'B': -1, 'Tie': 0}
+
+
+def read_episodes(rows, grid_size: int):
+    """
+    Group move records (dicts with the lines.csv columns, e.g. a
+    `csv.DictReader` or `Bases.lines`) into games and yield the edge ids
+    of each game in play order. Game ids restart with every run, so a
+    game also ends when `turn_id` stops increasing. Games with a line
+    off the board or drawn twice are skipped.
+    """
+    edge_index = board_tables(grid_size).edge_index
+    game_id, last_turn, edges, drawn, valid = None, 0, [], 0, True
+    for row in rows:
+        turn_id = int(row['turn_id'])
+        if edges and (row['game_id'] != game_id or turn_id <= last_turn):
+            if valid:
+                yield edges
+            edges, drawn, valid = [], 0, True
+        game_id, last_turn = row['game_id'], turn_id
+        edge = edge_index.get((int(row['x1']), int(row['y1']),
+                               int(row['x2']), int(row['y2'])))
+        if edge is None or drawn >> edge & 1:
+            valid = False
+        else:
+            drawn |= 1 << edge
+        edges.append(edge)
+    if edges and valid:
+        yield edges
+
+
+def replay_episode(grid_size: int, edges: list[int]):
+    """
+    Rebuild a game from an empty board. Returns the moves as
+    (player, state key, edge, completed box, potential box for the
+    opponent, next state key) and the winner, or None if the game was
+    not played to the end.
+    """
+    tables = board_tables(grid_size)
+    num_edges, box_masks = tables.num_edges, tables.box_masks
+    drawn, owner_bits = 0, 0
+    scores = {'A': 0, 'B': 0}
+    moves = []
+    for turn, edge in enumerate(edges):
+        # The turn passes after every move
+        player = 'B' if turn % 2 else 'A'
+        state = drawn | owner_bits << num_edges
+        drawn |= 1 << edge
+        completed, potential = 0, False
+        for box in tables.edge_boxes[edge]:
+            sides = (drawn & box_masks[box]).bit_count()
+            if sides == 4:
+                owner_bits |= OWNER_CODES[player] << 2 * box
+                completed += 1
+            elif sides == 3:
+                potential = True
+        scores[player] += completed
+        moves.append((player, state, edge, completed > 0, potential,
+                      drawn | owner_bits << num_edges))
+
+    if drawn != tables.full_mask:
+        return moves, None
+    if scores['A'] == scores['B']:
+        return moves, 'Tie'
+    return moves, 'A' if scores['A'] > scores['B'] else 'B'
+
+
+def train_on_episodes(episodes, agent_a: QLearningAgent,
+                      agent_b: QLearningAgent, chunk_games: int = 1000
+                      ) -> dict[str, int]:
+    """
+    Batched Q-updates from recorded games (lists of edge ids): each
+    agent learns the moves of its seat with its `enhance_reward` shaped
+    reward, plus the terminal reward on its last move of a finished
+    game. Updates are applied `chunk_games` games at a time.
+    """
+    grid_size = agent_a.grid_size
+    seats = {'A': agent_a, 'B': agent_b}
+    report = {'games': 0, 'moves': 0}
+    episodes = iter(episodes)
+    while True:
+        chunk = list(itertools.islice(episodes, chunk_games))
+        if not chunk:
+            break
+        transitions = {'A': [], 'B': []}
+        for edges in chunk:
+            moves, winner = replay_episode(grid_size, edges)
+            last_move = {move[0]: index for index, move in enumerate(moves)}
+            for index, (player, state, edge, completed_box,
+                        potential_box, next_state) in enumerate(moves):
+                reward = seats[player].enhance_reward(completed_box,
+                                                      potential_box)
+                if winner is not None and index == last_move[player]:
+                    sign = 1 if player == 'A' else -1
+                    reward += sign * RESULT_REWARDS[winner]
+                transitions[player].append((state, edge, reward, next_state))
+            report['moves'] += len(moves)
+        for player, agent in seats.items():
+            agent.update_batch(transitions[player])
+        report['games'] += len(chunk)
+    return report
+
+
+def train_offline(grid_size: int, source=None,
+                  agent_a: QLearningAgent | None = None,
+                  agent_b: QLearningAgent | None = None,
+                  chunk_games: int = 1000
+                  ) -> tuple[QLearningAgent, QLearningAgent]:
+    """
+    Train from logged games without re-simulating them. `source` is the
+    path of a CSV or binary move log (the configured lines log by
+    default), streamed in chunks, or any iterable of move records such
+    as `Bases.lines`.
+    With no `agent_b` one agent learns the moves of both seats.
+    """
+    if agent_a is None:
+        agent_a = QLearningAgent(grid_size)
+    if agent_b is None:
+        agent_b = agent_a
+    if source is None:
+        source = bases.LINES_LOG_PATH
+
+    start = time.perf_counter()
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        source = read_move_log(source)
+    report = train_on_episodes(read_episodes(source, grid_size),
+                               agent_a, agent_b, chunk_games)
+    elapsed = time.perf_counter() - start
+    print(f"Trained on {report['games']} games ({report['moves']} moves)",
+          f"in {elapsed:.1f}s",
+          f"({report['games'] / max(elapsed, 1e-9):.1f} games/s)")
+    return agent_a, agent_b
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Train a policy from a move log.")
+    parser.add_argument('lines_path')
+    parser.add_argument('out_path')
+    parser.add_argument('--grid-size', type=int, required=True)
+    parser.add_argument('--chunk-games', type=int, default=1000)
+    args = parser.parse_args()
+    agent, _ = train_offline(args.grid_size, args.lines_path,
+                             chunk_games=args.chunk_games)
+    agent.save_policy(args.out_path)
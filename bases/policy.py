@@ -0,0 +1,242 @@
+import ast
+import json
+import mmap
+import resource
+import struct
+import sys
+import time
+from array import array
+from .board import board_tables
+
+# magic, version, grid size, edges, key bytes, states,
+# learning rate, discount factor, exploration rate
+HEADER = struct.Struct('<4sHHHHQddd')
+MAGIC = b'BQTB'
+# Version 2: Q-value rows are indexed in the canonical symmetric frame
+VERSION = 2
+
+
+def is_binary_policy(file_path) -> bool:
+    with open(file_path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def key_bytes(grid_size: int) -> int:
+    """Bytes per state key: one bit per edge plus two per box."""
+    tables = board_tables(grid_size)
+    return (tables.num_edges + 2 * tables.num_boxes + 7) // 8
+
+
+def write_policy(file_path, q_table, grid_size: int, learning_rate: float,
+                 discount_factor: float, exploration_rate: float) -> None:
+    """
+    Write a Q-table as: header, sorted big-endian fixed-width state keys,
+    then one little-endian float32 row of per-edge Q-values per key.
+    Rows are streamed to the file so no second copy of the table is built.
+    """
+    num_edges = board_tables(grid_size).num_edges
+    width = key_bytes(grid_size)
+    keys = sorted(q_table)
+    with open(file_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, grid_size, num_edges, width,
+                            len(keys), learning_rate, discount_factor,
+                            exploration_rate))
+        for key in keys:
+            f.write(key.to_bytes(width, 'big'))
+        for key in keys:
+            values = array('f', q_table[key])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            f.write(values.tobytes())
+
+
+class MappedQTable:
+    """
+    Read-only, memory-mapped view of a binary policy file used in place of
+    the `QLearningAgent.q_table` dict. Lookups binary-search the sorted
+    key block, so nothing is loaded up front. Assigned rows are kept in an
+    in-memory overlay that takes precedence over the file.
+    """
+
+    def __init__(self, file_path):
+        with open(file_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.grid_size, self.num_edges, self.key_bytes,
+         self.num_states, self.learning_rate, self.discount_factor,
+         self.exploration_rate) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{file_path} is not a version {VERSION} "
+                             "binary policy")
+        self._values_offset = HEADER.size + self.num_states * self.key_bytes
+        self._row_bytes = 4 * self.num_edges
+        self.overlay = {}
+
+    def _find(self, key: int) -> int:
+        """Row index of `key` in the file, or -1."""
+        target = key.to_bytes(self.key_bytes, 'big')
+        mm, width, base = self._mm, self.key_bytes, HEADER.size
+        low, high = 0, self.num_states
+        while low < high:
+            middle = (low + high) // 2
+            start = base + middle * width
+            probe = mm[start:start + width]
+            if probe < target:
+                low = middle + 1
+            elif probe > target:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def get(self, key: int, default=None):
+        values = self.overlay.get(key)
+        if values is not None:
+            return values
+        row = self._find(key)
+        if row < 0:
+            return default
+        start = self._values_offset + row * self._row_bytes
+        values = array('f', self._mm[start:start + self._row_bytes])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def __getitem__(self, key: int):
+        values = self.get(key)
+        if values is None:
+            raise KeyError(key)
+        return values
+
+    def __setitem__(self, key: int, values) -> None:
+        self.overlay[key] = values
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.overlay or self._find(key) >= 0
+
+    def __len__(self) -> int:
+        return self.num_states + sum(1 for key in self.overlay
+                                     if self._find(key) < 0)
+
+    def keys(self):
+        seen = set(self.overlay)
+        yield from self.overlay
+        base, width = HEADER.size, self.key_bytes
+        for row in range(self.num_states):
+            start = base + row * width
+            key = int.from_bytes(self._mm[start:start + width], 'big')
+            if key not in seen:
+                yield key
+
+    __iter__ = keys
+
+    def items(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def convert_policy(json_path, out_path, grid_size: int,
+                   learning_rate: float = 0.0, discount_factor: float = 0.0,
+                   exploration_rate: float = 0.0) -> dict[str, int]:
+    """
+    Convert a policy.json into the binary format. Both JSON layouts are
+    read without `eval`:
+      - {state_key: [q-values]} as written by `save_policy`
+      - the older {str((state, move)): q_value} layout. Its lines had
+        their four coordinates sorted, which makes every line look like
+        its mirror image across the main diagonal; a state converts only
+        if each such pair is either fully drawn or not at all, and other
+        entries are skipped and counted. The state was canonical but the
+        move was in the frame of the board it was played on, so an old
+        entry applied to that move on every board of the state's
+        symmetry class. It is written to each of them, and entries that
+        land on the same canonical move are averaged.
+    """
+    from .agent import QLearningAgent
+
+    agent = QLearningAgent(grid_size)
+    tables = agent.tables
+    symmetry = agent.symmetry
+    with open(json_path, 'r') as f:
+        serialized_q_table = json.load(f)
+
+    # Old keys stored each line as its sorted coordinates
+    sorted_lines = {}
+    for edge, line in enumerate(tables.edges):
+        sorted_lines.setdefault(tuple(sorted(line)), []).append(edge)
+
+    def decode_lines(lines):
+        """Lines of an old state, or None if they are ambiguous."""
+        counts = {}
+        for line in lines:
+            key = tuple(sorted(line))
+            counts[key] = counts.get(key, 0) + 1
+        decoded = []
+        for key, count in counts.items():
+            edges = sorted_lines.get(key, [])
+            if count != len(edges):
+                return None
+            decoded.extend(tables.edges[edge] for edge in edges)
+        return decoded
+
+    report = {'converted': 0, 'skipped': 0}
+    old_values = {}
+    for key, value in serialized_q_table.items():
+        if isinstance(value, list):
+            agent.q_table[int(key)] = array('f', value)
+            report['converted'] += 1
+            continue
+        (lines, boxes), move = ast.literal_eval(key)
+        lines = decode_lines(lines)
+        edge = tables.edge_index.get(tuple(move))
+        if edge is None or lines is None:
+            report['skipped'] += 1
+            continue
+        state = agent.state_key((lines, boxes))
+        boards = {symmetry.permute(state, sym)
+                  for sym in range(len(symmetry.edge_perms))}
+        for board in boards:
+            canonical, perm = agent.canonical_state(board)
+            old_values.setdefault((canonical, perm[edge]), []).append(value)
+        report['converted'] += 1
+    for (state, edge), values in old_values.items():
+        agent.set_q(state, edge, sum(values) / len(values))
+
+    write_policy(out_path, agent.q_table, grid_size, learning_rate,
+                 discount_factor, exploration_rate)
+    print(f"Converted {report['converted']} entries",
+          f"({report['skipped']} ambiguous entries skipped)",
+          f"into {len(agent.q_table)} states in {out_path}")
+    return report
+
+
+def measure_policy_load(file_path, grid_size: int) -> dict[str, float]:
+    """Load time and peak RSS growth of `QLearningAgent.load_policy`."""
+    from .agent import QLearningAgent
+
+    agent = QLearningAgent(grid_size)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    agent.load_policy(file_path)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    report = {'seconds': elapsed, 'rss_mib': (rss_after - rss_before) / 1024}
+    print(f"Loaded {file_path} in {elapsed:.3f}s,",
+          f"peak RSS +{report['rss_mib']:.1f} MiB")
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert a policy.json into the binary policy format.")
+    parser.add_argument('json_path')
+    parser.add_argument('out_path')
+    parser.add_argument('--grid-size', type=int, required=True,
+                        help="boxes per side, e.g. 3 for a 4x4 dot grid")
+    args = parser.parse_args()
+    convert_policy(args.json_path, args.out_path, args.grid_size)
@@ -0,0 +1,163 @@
+import time
+from .board import board_tables
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchAgent:
+    """
+    Iterative-deepening alpha-beta (negamax) agent.
+
+    Positions are scored by box differential from the side to move: a move
+    is worth the boxes it completes minus the value of the reply. Since
+    the turn alternates after every move, the value of a position depends
+    only on its drawn edges, so the Zobrist hash of those edges (kept
+    incrementally by `Bases.draw_edge`) keys a fixed-size, always-replace
+    transposition table that is reused across moves and games.
+
+    Each move is searched until `time_limit` seconds or `node_limit` nodes
+    are spent (either may be None); the best move of the last completed
+    depth is played.
+    """
+
+    def __init__(self, time_limit: float = 1.0, node_limit: int | None = None,
+                 table_bits: int = 20):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.table_mask = (1 << table_bits) - 1
+        self.table = [None] * (1 << table_bits)
+        self.tables = None
+        self.nodes = 0
+        self.last_depth = 0
+        self.last_value = 0
+
+    def choose_action(self, game) -> tuple[int, int, int, int]:
+        if self.tables is None or self.tables.size != game.size:
+            self.tables = board_tables(game.size)
+            self.table = [None] * len(self.table)
+        edge, self.last_value, self.last_depth = self.search(game.drawn,
+                                                             game.zobrist)
+        return self.tables.edges[edge]
+
+    def search(self, drawn: int, key: int) -> tuple[int, int, int]:
+        """(best edge, value, depth reached) for the position `drawn`."""
+        tables = self.tables
+        remaining = (tables.full_mask & ~drawn).bit_count()
+        self.deadline = None if self.time_limit is None else \
+            time.perf_counter() + self.time_limit
+        self.nodes = 0
+        best_edge, best_value, depth_reached = None, 0, 0
+
+        for depth in range(1, remaining + 1):
+            try:
+                value, edge = self._root(drawn, key, depth)
+            except SearchTimeout:
+                break
+            best_edge, best_value, depth_reached = edge, value, depth
+
+        if best_edge is None:
+            # Not even depth 1 finished: fall back to the ordering heuristic
+            best_edge = self._ordered_moves(drawn, -1)[0]
+        return best_edge, best_value, depth_reached
+
+    def _root(self, drawn: int, key: int, depth: int) -> tuple[int, int]:
+        alpha, beta = -self.tables.num_boxes - 1, self.tables.num_boxes + 1
+        entry = self.table[key & self.table_mask]
+        tt_move = entry[4] if entry is not None and entry[0] == key else -1
+        best_edge = None
+        for edge in self._ordered_moves(drawn, tt_move):
+            gain = self.tables.completed_boxes(drawn, edge)
+            value = gain - self._negamax(drawn | 1 << edge,
+                                         key ^ self.tables.zobrist[edge],
+                                         depth - 1, gain - beta, gain - alpha)
+            if value > alpha or best_edge is None:
+                alpha, best_edge = max(alpha, value), edge
+        self.table[key & self.table_mask] = (key, depth, alpha, EXACT,
+                                             best_edge)
+        return alpha, best_edge
+
+    def _negamax(self, drawn: int, key: int, depth: int,
+                 alpha: int, beta: int) -> int:
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout
+        # The clock is read only every 1024 nodes
+        if self.deadline is not None and self.nodes & 1023 == 0 and \
+                time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        tables = self.tables
+        remaining = (tables.full_mask & ~drawn).bit_count()
+        if remaining == 0 or depth == 0:
+            return 0
+        # Searching to the end of the game gives an exact value
+        depth = min(depth, remaining)
+
+        slot = key & self.table_mask
+        entry = self.table[slot]
+        tt_move = -1
+        if entry is not None and entry[0] == key:
+            _, entry_depth, value, flag, tt_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        original_alpha = alpha
+        best_value, best_edge = -tables.num_boxes - 1, -1
+        zobrist = tables.zobrist
+        for edge in self._ordered_moves(drawn, tt_move):
+            gain = tables.completed_boxes(drawn, edge)
+            value = gain - self._negamax(drawn | 1 << edge,
+                                         key ^ zobrist[edge], depth - 1,
+                                         gain - beta, gain - alpha)
+            if value > best_value:
+                best_value, best_edge = value, edge
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[slot] = (key, depth, best_value, flag, best_edge)
+        return best_value
+
+    def _ordered_moves(self, drawn: int, tt_move: int) -> list[int]:
+        """
+        Free edges ordered: transposition-table move, moves that complete a
+        box, safe moves, then moves that leave a box with three sides.
+        """
+        tables = self.tables
+        captures, safe, unsafe = [], [], []
+        free = tables.full_mask & ~drawn
+        while free:
+            low = free & -free
+            edge = low.bit_length() - 1
+            free ^= low
+            if edge == tt_move:
+                continue
+            most_sides = 0
+            for box in tables.edge_boxes[edge]:
+                most_sides = max(most_sides,
+                                 (drawn & tables.box_masks[box]).bit_count())
+            if most_sides == 3:
+                captures.append(edge)
+            elif most_sides == 2:
+                unsafe.append(edge)
+            else:
+                safe.append(edge)
+        moves = captures + safe + unsafe
+        if tt_move >= 0:
+            moves.insert(0, tt_move)
+        return moves
@@ -0,0 +1,258 @@
+"""
+Policy server: one process holds a Q-policy and answers move requests
+from any number of games.
+
+    python -m bases.serve data/policy/policy.bin --grid-size 3 \\
+        --address unix:/tmp/bases.sock
+
+Clients (`RemoteAgent`) send the integer state key of their position
+and get back an edge id. Requests that arrive together are answered
+from one vectorized lookup (`QLearningAgent.q_matrix`), so concurrent
+games share the table and the work.
+"""
+import asyncio
+import os
+import socket
+import struct
+import time
+import numpy as np
+from .agent import QLearningAgent
+from .batch import (move_counts, padded_edge_boxes, random_legal_actions,
+                    tactical_ties)
+from .board import board_tables
+
+# Request: id, length of the state key, then the key (little-endian bytes)
+REQUEST = struct.Struct('<IH')
+# Response: id, edge id (-1 when there is no legal move)
+RESPONSE = struct.Struct('<Ih')
+DEFAULT_ADDRESS = 'localhost:8765'
+
+
+def parse_address(address: str) -> tuple:
+    """('unix', path) for 'unix:<path>', else ('tcp', host, port)."""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', host or 'localhost', int(port)
+
+
+class PolicyServer:
+    """
+    Serves the greedy moves of one policy over a Unix or TCP socket.
+
+    Each connection's requests are queued; a single batcher task takes
+    every queued request (up to `max_batch`), waiting at most
+    `max_delay` seconds for more, and answers them from one Q-value
+    matrix. With the default `max_delay` of 0 nothing waits: batches form
+    from requests that arrive while the previous batch is computed. A
+    batch that fails is answered with -1 and the server carries on. A
+    connection's requests are not read while its replies are backed up.
+
+    Ties between best moves are broken as by a local `QLearningAgent`
+    with the same `tactical_tie_break`, so `RemoteAgent` plays like one.
+    """
+
+    def __init__(self, policy_path, grid_size: int, max_batch: int = 256,
+                 max_delay: float = 0.0, tactical_tie_break: bool = True):
+        self.agent = QLearningAgent(grid_size, training_mode=False,
+                                    tactical_tie_break=tactical_tie_break)
+        self.agent.load_policy(policy_path)
+        self.tables = tables = board_tables(grid_size)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._edge_boxes = padded_edge_boxes(tables)
+        # Which edges are sides of which box, with the sink column
+        self._box_sides = np.zeros((tables.num_edges, tables.num_boxes + 1),
+                                   dtype=np.int8)
+        for edge, boxes in enumerate(tables.edge_boxes):
+            self._box_sides[edge, boxes] = 1
+        self.stats = {'requests': 0, 'batches': 0, 'connections': 0,
+                      'errors': 0}
+        self._key_bytes = (self.tables.num_edges + 7) // 8
+        self._max_key_bytes = (self.tables.num_edges +
+                               2 * self.tables.num_boxes + 7) // 8
+        self._queue = None
+
+    def best_edges(self, keys: list[int]) -> np.ndarray:
+        """Greedy edge id per state key, ties broken as in
+        `QLearningAgent.choose_actions`; -1 for full boards."""
+        full_mask = self.tables.full_mask
+        drawn = np.frombuffer(b''.join(
+            (key & full_mask).to_bytes(self._key_bytes, 'little')
+            for key in keys), dtype=np.uint8).reshape(len(keys), -1)
+        legal = ~np.unpackbits(drawn, axis=1, bitorder='little')[
+            :, :self.tables.num_edges].astype(bool)
+        q_values = self.agent.q_matrix(keys)
+        q_values[~legal] = -np.inf
+        best = (q_values == q_values.max(axis=1, keepdims=True)) & legal
+        if self.agent.tactical_tie_break:
+            sides = (~legal).astype(np.int8) @ self._box_sides
+            best = tactical_ties(best, *move_counts(sides, self._edge_boxes,
+                                                    legal))
+        edges = random_legal_actions(best)
+        edges[~legal.any(axis=1)] = -1
+        return edges
+
+    async def _handle(self, reader, writer) -> None:
+        self.stats['connections'] += 1
+        try:
+            while True:
+                request_id, length = REQUEST.unpack(
+                    await reader.readexactly(REQUEST.size))
+                key = int.from_bytes(await reader.readexactly(length),
+                                     'little')
+                if length > self._max_key_bytes:
+                    writer.write(RESPONSE.pack(request_id, -1))
+                else:
+                    self._queue.put_nowait((request_id, key, writer))
+                # Replies are written by the batcher; wait here while a
+                # slow reader has them piling up
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(),
+                                                        remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                edges = self.best_edges([key for _, key, _ in batch]).tolist()
+            except Exception as error:
+                print(f"Batch of {len(batch)} requests failed: {error!r}")
+                edges = [-1] * len(batch)
+                self.stats['errors'] += 1
+            for (request_id, _, writer), edge in zip(batch, edges):
+                if not writer.is_closing():
+                    writer.write(RESPONSE.pack(request_id, edge))
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+
+    async def serve(self, address: str = DEFAULT_ADDRESS,
+                    ready=None) -> None:
+        """Serve until cancelled; `ready` (an `asyncio.Event` or a
+        threading/multiprocessing Event) is set once listening."""
+        self._queue = asyncio.Queue()
+        kind, *where = parse_address(address)
+        if kind == 'unix':
+            if os.path.exists(where[0]):
+                os.remove(where[0])
+            server = await asyncio.start_unix_server(self._handle, where[0])
+        else:
+            server = await asyncio.start_server(self._handle, *where)
+        batcher = asyncio.create_task(self._batcher())
+        print(f"Serving {self.tables.size}x{self.tables.size} policy",
+              f"({len(self.agent.q_table)} states) on {address}")
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def serve(policy_path, grid_size: int, address: str = DEFAULT_ADDRESS,
+          max_batch: int = 256, max_delay: float = 0.0, ready=None,
+          tactical_tie_break: bool = True) -> None:
+    """Run a `PolicyServer` until interrupted."""
+    server = PolicyServer(policy_path, grid_size, max_batch, max_delay,
+                          tactical_tie_break)
+    try:
+        asyncio.run(server.serve(address, ready))
+    except KeyboardInterrupt:
+        pass
+    print(f"Answered {server.stats['requests']} requests in",
+          f"{server.stats['batches']} batches")
+
+
+class RemoteAgent:
+    """
+    Agent whose moves come from a `PolicyServer`; use it in `Bases.play`
+    or `simulate` like a `QLearningAgent` that does not learn. The
+    connection is opened on the first move.
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS,
+                 timeout: float = 5.0):
+        self.address = address
+        self.timeout = timeout
+        self._socket = None
+        self._next_id = 0
+        self.last_latency = None
+
+    def _connect(self) -> socket.socket:
+        kind, *where = parse_address(self.address)
+        if kind == 'unix':
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            connection.connect(where[0])
+        else:
+            connection = socket.create_connection(tuple(where),
+                                                  self.timeout)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connection
+
+    def _receive(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Policy server closed the connection")
+            data += chunk
+        return data
+
+    def choose_action(self, game) -> tuple[int, int, int, int]:
+        if self._socket is None:
+            self._socket = self._connect()
+        key = game.get_state_key()
+        data = key.to_bytes(max(1, (key.bit_length() + 7) // 8), 'little')
+        self._next_id = (self._next_id + 1) % 2**32
+        start = time.perf_counter()
+        self._socket.sendall(REQUEST.pack(self._next_id, len(data)) + data)
+        request_id, edge = RESPONSE.unpack(self._receive(RESPONSE.size))
+        self.last_latency = time.perf_counter() - start
+        if request_id != self._next_id or edge < 0:
+            raise RuntimeError(f"Bad reply from the policy server: "
+                               f"request {request_id}, edge {edge}")
+        return game.tables.edges[edge]
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Serve a Q-policy to RemoteAgent clients.")
+    parser.add_argument('policy_path')
+    parser.add_argument('--grid-size', type=int, required=True,
+                        help="boxes per side")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS,
+                        help="host:port or unix:<path>")
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay', type=float, default=0.0,
+                        help="seconds to wait for a batch to fill")
+    parser.add_argument('--no-tie-break', action='store_true',
+                        help="break ties at random, not by boxes "
+                        "completed and given away")
+    args = parser.parse_args()
+    serve(args.policy_path, args.grid_size, args.address, args.max_batch,
+          args.max_delay, tactical_tie_break=not args.no_tie_break)
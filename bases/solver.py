@@ -0,0 +1,253 @@
+import multiprocessing as mp
+import os
+import random
+import struct
+import time
+import numpy as np
+from .board import board_tables, symmetry_tables
+
+# magic, version, grid size, edges, lowest solved level (drawn edge count)
+HEADER = struct.Struct('<4sHHHh')
+MAGIC = b'BSOL'
+VERSION = 1
+CHUNK = 1 << 20
+
+
+class SolvedTable:
+    """
+    Memory-mapped perfect-play table for one grid size.
+
+    Positions are indexed by their drawn-edge mask. Since the turn passes
+    after every move, the rest of the game depends only on that mask:
+    `values[mask]` is the exact box margin the player to move still gets
+    and `best[mask]` an optimal edge (-1 on a full board).
+    """
+
+    def __init__(self, path, mode: str = 'r'):
+        with open(path, 'rb') as f:
+            magic, version, self.grid_size, self.num_edges, \
+                self.solved_level = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} "
+                             "solved table")
+        self.path = path
+        count = 1 << self.num_edges
+        self.values = np.memmap(path, dtype=np.int8, mode=mode,
+                                offset=HEADER.size, shape=(count,))
+        self.best = np.memmap(path, dtype=np.int8, mode=mode,
+                              offset=HEADER.size + count, shape=(count,))
+
+    @property
+    def complete(self) -> bool:
+        return self.solved_level == 0
+
+    @classmethod
+    def create(cls, path, grid_size: int) -> 'SolvedTable':
+        tables = board_tables(grid_size)
+        count = 1 << tables.num_edges
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, grid_size, tables.num_edges,
+                                tables.num_edges))
+            f.truncate(HEADER.size + 2 * count)
+        table = cls(path, mode='r+')
+        table.best[tables.full_mask] = -1
+        return table
+
+    def checkpoint(self, level: int) -> None:
+        """Flush solved levels and record `level` as the lowest one."""
+        self.values.flush()
+        self.best.flush()
+        self.solved_level = level
+        with open(self.path, 'r+b') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.grid_size,
+                                self.num_edges, level))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _permute_masks(masks: np.ndarray, lookups: list) -> np.ndarray:
+    permuted = np.zeros_like(masks)
+    for index, lookup in enumerate(lookups):
+        permuted |= lookup[(masks >> (8 * index)) & 255]
+    return permuted
+
+
+def _canonical_masks(masks: np.ndarray, symmetry_lookups: list):
+    """(canonical masks, symmetry mapping each mask to its canonical)."""
+    canonical = masks.copy()
+    sym = np.zeros(len(masks), dtype=np.int8)
+    for index, lookups in enumerate(symmetry_lookups[1:], 1):
+        permuted = _permute_masks(masks, lookups)
+        smaller = permuted < canonical
+        canonical[smaller] = permuted[smaller]
+        sym[smaller] = index
+    return canonical, sym
+
+
+_worker_table = None
+
+
+def _init_worker(path) -> None:
+    global _worker_table
+    _worker_table = SolvedTable(path)
+
+
+def _solve_masks(args) -> tuple[np.ndarray, np.ndarray]:
+    """Best value and edge of each mask from its already solved children."""
+    grid_size, masks = args
+    tables = board_tables(grid_size)
+    values = _worker_table.values
+    best_value = np.full(len(masks), -128, dtype=np.int16)
+    best_edge = np.full(len(masks), -1, dtype=np.int8)
+    for edge in range(tables.num_edges):
+        free = (masks >> edge) & 1 == 0
+        if not free.any():
+            continue
+        children = masks[free] | (1 << edge)
+        gain = np.zeros(len(children), dtype=np.int16)
+        for box in tables.edge_boxes[edge]:
+            box_mask = tables.box_masks[box]
+            gain += (children & box_mask) == box_mask
+        value = gain - values[children]
+        improved = value > best_value[free]
+        positions = np.flatnonzero(free)[improved]
+        best_value[positions] = value[improved]
+        best_edge[positions] = edge
+    return best_value.astype(np.int8), best_edge
+
+
+def solve(path, grid_size: int, workers: int = 1) -> SolvedTable:
+    """
+    Retrograde solve of every position of a `grid_size` board, level by
+    level from the full board down to the empty one. Only canonical
+    positions under the 8 board symmetries are searched; the others are
+    filled from them. Each finished level is checkpointed into the
+    table's header, and an existing table at `path` is resumed.
+    """
+    tables = board_tables(grid_size)
+    if tables.num_edges > 32:
+        raise ValueError("Exhaustive solving is limited to 3x3 boxes")
+    if os.path.exists(path):
+        table = SolvedTable(path, mode='r+')
+        if table.grid_size != grid_size:
+            raise ValueError(f"{path} holds grid size {table.grid_size}")
+        print(f"Resuming from level {table.solved_level}")
+    else:
+        table = SolvedTable.create(path, grid_size)
+
+    symmetry = symmetry_tables(grid_size)
+    num_bytes = (tables.num_edges + 7) // 8
+    symmetry_lookups = [[np.array(symmetry.byte_tables[sym][index],
+                                  dtype=np.int64)
+                         for index in range(num_bytes)]
+                        for sym in range(8)]
+    inverse_perms = np.zeros((8, tables.num_edges), dtype=np.int8)
+    for sym, perm in enumerate(symmetry.edge_perms):
+        for edge, image in enumerate(perm):
+            inverse_perms[sym, image] = edge
+
+    all_masks = np.arange(1 << tables.num_edges, dtype=np.int64)
+    popcount = np.zeros(len(all_masks), dtype=np.int8)
+    for edge in range(tables.num_edges):
+        popcount += ((all_masks >> edge) & 1).astype(np.int8)
+
+    pool = mp.Pool(workers, _init_worker, (path,)) if workers > 1 else None
+    if pool is None:
+        _init_worker(path)
+    try:
+        for level in range(table.solved_level - 1, -1, -1):
+            start = time.perf_counter()
+            level_masks = all_masks[popcount == level]
+            chunks = []
+            for offset in range(0, len(level_masks), CHUNK):
+                masks = level_masks[offset:offset + CHUNK]
+                canonical, sym = _canonical_masks(masks, symmetry_lookups)
+                chunks.append((masks, canonical, sym))
+
+            representatives = np.concatenate(
+                [masks[canonical == masks]
+                 for masks, canonical, _ in chunks])
+            jobs = [(grid_size, representatives[offset:offset + CHUNK // 8])
+                    for offset in range(0, len(representatives),
+                                        CHUNK // 8)]
+            results = pool.map(_solve_masks, jobs) if pool else \
+                map(_solve_masks, jobs)
+            for (_, masks), (values, best) in zip(jobs, results):
+                table.values[masks] = values
+                table.best[masks] = best
+
+            for masks, canonical, sym in chunks:
+                other = canonical != masks
+                table.values[masks[other]] = table.values[canonical[other]]
+                table.best[masks[other]] = inverse_perms[
+                    sym[other], table.best[canonical[other]]]
+            table.checkpoint(level)
+            print(f"Level {level}: {len(level_masks)} positions",
+                  f"({len(representatives)} canonical) in",
+                  f"{time.perf_counter() - start:.1f}s")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return SolvedTable(path)
+
+
+class SolvedAgent:
+    """Perfect player reading moves from a solved table."""
+
+    def __init__(self, path):
+        self.table = SolvedTable(path)
+        if not self.table.complete:
+            raise ValueError(f"{path} is not fully solved")
+
+    def choose_action(self, game) -> tuple[int, int, int, int]:
+        return game.tables.edges[int(self.table.best[game.drawn])]
+
+    def value(self, game) -> int:
+        """Exact remaining box margin for the player to move."""
+        return int(self.table.values[game.drawn])
+
+
+def score_agent(agent, path, samples: int = 1000,
+                seed: int | None = None) -> dict[str, float]:
+    """
+    Score an agent's moves against a solved table on random positions
+    reached by random play: the share of optimal moves and the mean
+    number of boxes lost per move compared with perfect play.
+    """
+    from .game import Bases
+
+    rng = random.Random(seed)
+    table = SolvedTable(path)
+    game = Bases(table.grid_size)
+    optimal, loss = 0, 0
+    for _ in range(samples):
+        game.reset()
+        for edge in rng.sample(range(table.num_edges),
+                               rng.randrange(table.num_edges)):
+            game.draw_edge(edge)
+            game.turn = 'B' if game.turn == 'A' else 'A'
+        move = agent.choose_action(game)
+        edge = game.tables.edge_index[move]
+        value = game.tables.completed_boxes(game.drawn, edge) - \
+            int(table.values[game.drawn | 1 << edge])
+        best = int(table.values[game.drawn])
+        optimal += value == best
+        loss += best - value
+    report = {'optimal_rate': optimal / samples, 'mean_loss': loss / samples}
+    print(f"Optimal moves: {report['optimal_rate']:.1%},",
+          f"mean boxes lost per move: {report['mean_loss']:.3f}")
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Solve a small Bases board exhaustively.")
+    parser.add_argument('path')
+    parser.add_argument('--grid-size', type=int, required=True,
+                        help="boxes per side, 2 or 3")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    solve(args.path, args.grid_size, args.workers)
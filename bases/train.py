@@ -1,52 +1,252 @@
 from .game import Bases
 from .agent import QLearningAgent
 from .agent import RandomAgent
+from .batch import BatchBases
+from .offline import read_episodes, train_on_episodes
+from .checkpoint import Checkpointer
+from . import instrument
+from .config import ensure_parent
 import bases
 import random
 import csv
+import os
+import time
+import contextlib
+import sys
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import numpy as np
+from array import array
 
 
-def train_agents(grid_size: int, episodes: int) -> None:
-    agent_a = QLearningAgent(grid_size)
-    agent_b = QLearningAgent(grid_size)
+def train_agents(grid_size: int, episodes: int, workers: int = 1,
+                 merge_every: int = 100, merge: str = 'average',
+                 seed: int | None = None, instrumentation=None,
+                 checkpoint_dir=None, checkpoint_every: int = 1000,
+                 resume: bool = False) -> None:
+    """
+    Self-play training of two Q-learning agents.
+    With `workers` > 1 each process trains its own copy of the Q-tables
+    for `merge_every` episodes between merges into the master tables
+    (`merge` is 'average' or 'visits'). Runs are reproducible for a
+    given `seed` and worker count. An `instrument.Instrumentation` is
+    enabled for the run; workers send it their measurements after every
+    merge round and profile into subdirectories of its `profile_dir`.
 
-    rewards = {'A': 1, 'B': -1, 'Tie': 0}
+    With `checkpoint_dir`, the Q-entries changed since the previous
+    checkpoint, the win counts and RNG states are saved there every
+    `checkpoint_every` episodes (after the merge round that reaches it
+    with workers). `resume` continues a run from its last checkpoint up
+    to a total of `episodes`; workers are reseeded rather than resumed.
+    """
+    if merge not in MERGE_STRATEGIES:
+        raise ValueError(f"Unknown merge strategy '{merge}'")
+    with instrumentation or contextlib.nullcontext():
+        _train_agents(grid_size, episodes, workers, merge_every, merge,
+                      seed, checkpoint_dir, checkpoint_every, resume)
 
-    game = Bases(grid_size)
-    for episode in range(episodes):
-        winner = game.play(agent_a, agent_b)
-
-        reward_a = rewards[winner]
-        reward_b = -reward_a
-
-        state = game.get_detailed_state()
-        for action in game.lines:
-            completed_box, potential_box_opponent = \
-                game.make_move(action['x1'], action['y1'],
-                               action['x2'], action['y2'])[1:]
-            specific_reward_a = \
-                agent_a.enhance_reward(completed_box, potential_box_opponent)
-            specific_reward_b = \
-                agent_b.enhance_reward(completed_box, potential_box_opponent)
-            next_state = game.get_detailed_state()
-            available_moves = game.available_moves()
-            agent_a.update(state, (action['x1'], action['y1'],
-                                   action['x2'], action['y2']),
-                           reward_a + specific_reward_a,
-                           next_state, available_moves)
-            agent_b.update(state, (action['x1'], action['y1'],
-                                   action['x2'], action['y2']),
-                           reward_b + specific_reward_b,
-                           next_state, available_moves)
-            state = next_state
-
-    if game.wins['A'] >= game.wins['B']:
-        agent_a.save_policy(bases.cfg['policy_path'])
-        print("Saving AI Agent A's Policy")
+
+def _train_agents(grid_size: int, episodes: int, workers: int,
+                  merge_every: int, merge: str, seed: int | None,
+                  checkpoint_dir=None, checkpoint_every: int = 1000,
+                  resume: bool = False) -> None:
+    start = time.perf_counter()
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    agent_a = _new_agent(grid_size)
+    agent_b = _new_agent(grid_size)
+    wins = {'A': 0, 'B': 0, 'Tie': 0}
+    done = 0
+    checkpointer = None
+    if checkpoint_dir is not None:
+        checkpointer = Checkpointer(checkpoint_dir, (agent_a, agent_b),
+                                    checkpoint_every)
+        state = checkpointer.restore() if resume else None
+        if state is not None:
+            wins, done = state['wins'], state['episode']
+            print(f"Resuming from episode {done} in {checkpoint_dir}")
+        else:
+            if resume:
+                print(f"No checkpoint in {checkpoint_dir}, starting over")
+            checkpointer.clear()
+
+    if workers > 1:
+        wins = _train_parallel(grid_size, episodes, workers, merge_every,
+                               merge, seed, (agent_a, agent_b), wins, done,
+                               checkpointer)
     else:
-        agent_b.save_policy(bases.cfg['policy_path'])
-        print("Saving AI Agent B's Policy")
+        game = Bases(grid_size)
+        game.wins = wins
+        instrumentation = instrument.active()
+        for episode in range(done, episodes):
+            _self_play_episode(game, agent_a, agent_b)
+            if instrumentation is not None:
+                instrumentation.episode()
+            if checkpointer is not None:
+                checkpointer.maybe_save(episode + 1, wins)
+    if checkpointer is not None:
+        if checkpointer.last_episode < max(episodes, done):
+            checkpointer.save(max(episodes, done), wins)
+        checkpointer.wait()
+
+    elapsed = time.perf_counter() - start
+    played = max(episodes - done, 0)
+    print(f"Trained {played} episodes in {elapsed:.1f}s",
+          f"({played / max(elapsed, 1e-9):.1f} games/s)")
+    print(f"Games won by A: {wins['A']}, B: {wins['B']}",
+          f"Ties: {wins['Tie']}")
+
+    best, name = (agent_a, 'A') if wins['A'] >= wins['B'] else (agent_b, 'B')
+    pruned = best.prune(bases.cfg.get('prune_magnitude', 0.0))
+    best.save_policy(bases.cfg['policy_path'])
+    print(f"Saving AI Agent {name}'s Policy",
+          f"({len(best.q_table)} states, {pruned} pruned)")
+
+
+def _new_agent(grid_size: int) -> QLearningAgent:
+    """Self-play agent with the Q-table limits of the settings."""
+    cfg = bases.cfg
+    return QLearningAgent(
+        grid_size, max_states=cfg.get('max_states'),
+        eviction=cfg.get('eviction', 'lru'),
+        adaptive_learning_rate=cfg.get('adaptive_learning_rate', False))
+
+
+def _self_play_episode(game: Bases, agent_a: QLearningAgent,
+                       agent_b: QLearningAgent) -> str:
+    """Play one game, then replay it from an empty board to learn the
+    terminal and shaped rewards."""
+    winner = game.simulate(agent_a, agent_b)
+    train_on_episodes(read_episodes(game.lines, game.size),
+                      agent_a, agent_b)
+    return winner
+
+
+def _merge_average(master: QLearningAgent, deltas: list[dict]) -> dict:
+    """Mean over workers; a worker that did not touch a (state, edge) key
+    keeps the master value."""
+    merged = {}
+    for key in set().union(*deltas):
+        base = master.get_q(*key)
+        merged[key] = sum(delta[key][0] if key in delta else base
+                          for delta in deltas) / len(deltas)
+    return merged
+
+
+def _merge_visits(master: QLearningAgent, deltas: list[dict]) -> dict:
+    """Mean over workers weighted by how often each updated the key."""
+    merged = {}
+    for key in set().union(*deltas):
+        total = sum(delta[key][1] for delta in deltas if key in delta)
+        merged[key] = sum(delta[key][0] * delta[key][1]
+                          for delta in deltas if key in delta) / total
+    return merged
+
+
+MERGE_STRATEGIES = {'average': _merge_average, 'visits': _merge_visits}
+
+
+def _self_play_worker(conn, grid_size: int, seed: int | None,
+                      tables: tuple = ({}, {}),
+                      instrument_settings: dict | None = None) -> None:
+    """
+    Worker loop: receive (episodes, merged entries), apply the entries,
+    play the episodes and send back the entries changed since the last
+    merge as {(state, edge): (value, visits)}, the round's win counts and
+    the measurements of its instrumentation (or None). The agents start
+    from copies of `tables`.
+    """
+    instrumentation = instrument.start_worker(instrument_settings)
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    agents = (_new_agent(grid_size), _new_agent(grid_size))
+    for agent, table in zip(agents, tables):
+        agent.q_table = {state: array('f', values)
+                         for state, values in table.items()}
+    game = Bases(grid_size)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        episodes, merged = message
+        for agent, entries in zip(agents, merged):
+            for key, value in entries.items():
+                agent.set_q(*key, value)
+            agent.visits = {}
+        game.wins = {'A': 0, 'B': 0, 'Tie': 0}
+        for _ in range(episodes):
+            _self_play_episode(game, *agents)
+            if instrumentation is not None:
+                instrumentation.episode()
+        # States evicted during the round are not reported as zeros
+        conn.send(([{key: (agent.get_q(*key), visits)
+                     for key, visits in agent.visits.items()
+                     if key[0] in agent.q_table}
+                    for agent in agents], game.wins,
+                   None if instrumentation is None
+                   else instrumentation.take()))
+    if instrumentation is not None:
+        instrumentation.disable()
+    conn.close()
+
+
+def _train_parallel(grid_size: int, episodes: int, workers: int,
+                    merge_every: int, merge: str, seed: int | None,
+                    agents: tuple, wins: dict, done: int = 0,
+                    checkpointer: Checkpointer | None = None) -> dict:
+    """Train `agents` from episode `done` to `episodes`; returns the
+    updated win counts."""
+    merge_tables = MERGE_STRATEGIES[merge]
+    tables = tuple(dict(agent.q_table) for agent in agents)
+    instrumentation = instrument.active()
+    if instrumentation is not None:
+        instrumentation.agents.update(agents)
+    pipes, processes = [], []
+    for worker in range(workers):
+        parent, child = mp.Pipe()
+        worker_seed = None if seed is None else seed + worker + done
+        settings = None if instrumentation is None else \
+            instrumentation.worker_settings(f'worker_{worker}')
+        process = mp.Process(target=_self_play_worker,
+                             args=(child, grid_size, worker_seed, tables,
+                                   settings),
+                             daemon=True)
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+
+    del tables
+    merged = ({}, {})
+    remaining = episodes - done
+    try:
+        while remaining > 0:
+            round_episodes = min(merge_every * workers, remaining)
+            share, extra = divmod(round_episodes, workers)
+            for worker, conn in enumerate(pipes):
+                conn.send((share + (worker < extra), merged))
+            replies = [conn.recv() for conn in pipes]
+            merged = tuple(
+                merge_tables(agent, [reply[0][i] for reply in replies])
+                for i, agent in enumerate(agents))
+            for agent, entries in zip(agents, merged):
+                for key, value in entries.items():
+                    agent.set_q(*key, value)
+            for _, round_wins, measurements in replies:
+                for result, count in round_wins.items():
+                    wins[result] += count
+                if measurements is not None:
+                    instrumentation.merge(*measurements)
+            remaining -= round_episodes
+            if checkpointer is not None:
+                checkpointer.maybe_save(episodes - remaining, wins)
+    finally:
+        for conn in pipes:
+            conn.send(None)
+        for process in processes:
+            process.join()
+    return wins
 
 
 def evaluate_hyperparameters(learning_rate: float, discount_factor: float,
@@ -59,60 +259,217 @@ def evaluate_hyperparameters(learning_rate: float, discount_factor: float,
 
     # Training phase
     for _ in range(train_episodes):
-        game.play(agent, opponent)
+        game.simulate(agent, opponent)
 
     # Evaluation phase
     agent.training_mode = False
-    wins = 0
-    for _ in range(test_episodes):
-        result = game.play(agent, opponent)
-        if result == 'A':
-            wins += 1
-
-    win_rate = wins / test_episodes
+    results = evaluate_batch(agent, opponent, grid_size, test_episodes)
+    win_rate = results['A'] / test_episodes
     return win_rate
 
 
+def evaluate_batch(player_a, player_b, grid_size: int, games: int,
+                   batch_size: int = 256) -> dict[str, int]:
+    """
+    Play `games` games between two batch-capable agents (`choose_actions`)
+    on a `BatchBases`, without learning. Returns win counts by result.
+    """
+    wins = {'A': 0, 'B': 0, 'Tie': 0}
+    remaining = games
+    while remaining > 0:
+        batch = BatchBases(grid_size, min(batch_size, remaining))
+        done = np.zeros(batch.num_games, dtype=bool)
+        while not done.all():
+            player = player_a if batch.turn[0] == 0 else player_b
+            _, done, results = batch.step(player.choose_actions(batch))
+        for result, count in zip(('A', 'B', 'Tie'),
+                                 np.bincount(results, minlength=3)):
+            wins[result] += int(count)
+        remaining -= batch.num_games
+    return wins
+
+
+def _train_and_evaluate(grid_size: int, params: dict[str, float],
+                        q_table: dict, trained: int, budget: int,
+                        test_episodes: int, seed: int | None,
+                        instrument_settings: dict | None = None):
+    """
+    Continue training a trial's agent against `RandomAgent` from `trained`
+    up to `budget` episodes, then measure its win rate. In a worker
+    process, `instrument_settings` measure the training with a new
+    `instrument.Instrumentation`.
+    Returns (win_rate, q_table, its measurements or None).
+    """
+    worker = instrument_settings is not None
+    instrumentation = instrument.start_worker(instrument_settings) \
+        if worker else instrument.active()
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed % 2**32)
+    agent = QLearningAgent(grid_size, params['learning_rate'],
+                           params['discount_factor'],
+                           params['exploration_rate'], training_mode=True)
+    agent.q_table = q_table
+    opponent = RandomAgent()
+    game = Bases(grid_size)
+    for _ in range(budget - trained):
+        game.simulate(agent, opponent)
+        if instrumentation is not None:
+            instrumentation.episode()
+    measurements = None
+    if worker and instrumentation is not None:
+        instrumentation.disable()
+        measurements = instrumentation.take()
+
+    agent.training_mode = False
+    results = evaluate_batch(agent, opponent, grid_size, test_episodes)
+    return results['A'] / test_episodes, agent.q_table, measurements
+
+
+def rung_budgets(train_episodes: int, eta: int,
+                 min_episodes: int | None = None) -> list[int]:
+    """Training episodes per successive-halving rung, ending at the full
+    `train_episodes` budget."""
+    if min_episodes is None:
+        min_episodes = max(1, train_episodes // eta ** 2)
+    budgets = []
+    budget = min_episodes
+    while budget < train_episodes:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(train_episodes)
+    return budgets
+
+
 def hyperparameter_tuning(grid_size,
                           iterations,
                           train_episodes,
-                          test_episodes) -> dict[str, float]:
-    """Incomplete and poor implementation. """
-    best_params = None
-    best_score = -np.inf
-    results = []
-
-    for i in range(iterations):
-        learning_rate = random.uniform(0.01, 1.0)
-        discount_factor = random.uniform(0.5, 0.99)
-        exploration_rate = random.uniform(0.01, 0.3)
-
-        print(f"Testing combination {i+1}/{iterations}: \
-              lr={learning_rate:.4f}, \
-              df={discount_factor:.4f}, \
-              er={exploration_rate:.4f}")
-
-        score = evaluate_hyperparameters(
-            learning_rate, discount_factor, exploration_rate,
-            grid_size, train_episodes, test_episodes
-        )
+                          test_episodes,
+                          workers: int = 1,
+                          eta: int = 3,
+                          min_episodes: int | None = None,
+                          seed: int | None = None,
+                          instrumentation=None) -> dict[str, float]:
+    """
+    Random search over (learning_rate, discount_factor, exploration_rate)
+    with asynchronous successive halving (ASHA).
+
+    Every trial is trained to the first rung budget and scored by its win
+    rate against `RandomAgent`. Whenever a worker is free, the best
+    unpromoted trial in the top 1/`eta` of any rung is trained on to the
+    next rung; otherwise a new trial is started. Trials that are never
+    promoted stop early. Once no new trials are left, the best trial of
+    the highest rung reached is promoted until one has been trained for
+    the full `train_episodes`. Jobs run on `workers` processes. An
+    `instrument.Instrumentation` is enabled for the run; with workers,
+    each job's measurements are merged into it when the job finishes.
+    """
+    with instrumentation or contextlib.nullcontext():
+        return _hyperparameter_tuning(grid_size, iterations, train_episodes,
+                                      test_episodes, workers, eta,
+                                      min_episodes, seed)
 
-        print(f"Winning Rate: {score:.4f}")
 
-        results.append({
-            'learning_rate': learning_rate,
-            'discount_factor': discount_factor,
-            'exploration_rate': exploration_rate,
-            'win_rate': score
-        })
+def _hyperparameter_tuning(grid_size, iterations, train_episodes,
+                           test_episodes, workers, eta, min_episodes,
+                           seed) -> dict[str, float]:
+    rng = random.Random(seed)
+    budgets = rung_budgets(train_episodes, eta, min_episodes)
+    trials = []
+    rung_scores = [[] for _ in budgets]  # (win_rate, trial) per rung
+    promoted = [set() for _ in budgets]
+    rows = []
+    instrumentation = instrument.active()
 
-        if score > best_score:
-            best_score = score
-            best_params = {
-                'learning_rate': learning_rate,
-                'discount_factor': discount_factor,
-                'exploration_rate': exploration_rate
-            }
+    def next_job():
+        # Prefer promotions from the highest rung
+        for rung in reversed(range(len(budgets) - 1)):
+            ranked = sorted(rung_scores[rung], reverse=True)
+            for score, trial in ranked[:len(ranked) // eta]:
+                if trial not in promoted[rung]:
+                    promoted[rung].add(trial)
+                    return trial, rung + 1
+        if len(trials) < iterations:
+            trials.append({
+                'params': {
+                    'learning_rate': rng.uniform(0.01, 1.0),
+                    'discount_factor': rng.uniform(0.5, 0.99),
+                    'exploration_rate': rng.uniform(0.01, 0.3)
+                },
+                'q_table': {}, 'trained': 0, 'rung': -1, 'win_rate': None
+            })
+            params = trials[-1]['params']
+            print(f"Testing combination {len(trials)}/{iterations}:",
+                  f"lr={params['learning_rate']:.4f},",
+                  f"df={params['discount_factor']:.4f},",
+                  f"er={params['exploration_rate']:.4f}")
+            return len(trials) - 1, 0
+        if rung_scores[-1]:
+            return None
+        # Too few trials to fill the top 1/eta: promote the best one of
+        # the highest rung reached unless one is on its way up already
+        rung = max(rung for rung, scores in enumerate(rung_scores)
+                   if scores) if any(rung_scores) else None
+        if rung is None or promoted[rung] - \
+                {trial for _, trial in rung_scores[rung + 1]}:
+            return None
+        for score, trial in sorted(rung_scores[rung], reverse=True):
+            if trial not in promoted[rung]:
+                promoted[rung].add(trial)
+                return trial, rung + 1
+        return None
+
+    def submit(run, trial, rung, in_worker=False):
+        job_seed = None if seed is None else hash((seed, trial, rung))
+        settings = None
+        if in_worker and instrumentation is not None:
+            settings = instrumentation.worker_settings(
+                f'trial_{trial + 1}_rung_{rung}')
+        return run(_train_and_evaluate, grid_size,
+                   trials[trial]['params'], trials[trial]['q_table'],
+                   trials[trial]['trained'], budgets[rung],
+                   test_episodes, job_seed, settings)
+
+    def record(trial, rung, win_rate, q_table, measurements):
+        if measurements is not None:
+            instrumentation.merge(*measurements)
+        state = trials[trial]
+        state.update(q_table=q_table, trained=budgets[rung], rung=rung,
+                     win_rate=win_rate)
+        rung_scores[rung].append((win_rate, trial))
+        rows.append({'row_type': 'rung', 'trial': trial + 1, 'rung': rung,
+                     'train_episodes': budgets[rung], **state['params'],
+                     'win_rate': win_rate})
+        print(f"Trial {trial + 1} rung {rung}",
+              f"({budgets[rung]} episodes): Winning Rate: {win_rate:.4f}")
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            running = {}
+            while True:
+                while len(running) < workers:
+                    job = next_job()
+                    if job is None:
+                        break
+                    running[submit(pool.submit, *job, True)] = job
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(*running.pop(future), *future.result())
+    else:
+        while (job := next_job()) is not None:
+            record(*job, *submit(lambda f, *args: f(*args), *job))
+
+    best_trial = max(trials, key=lambda t: (t['rung'], t['win_rate']))
+    best_params = best_trial['params']
+    best_score = best_trial['win_rate']
+    for trial, state in enumerate(trials):
+        state['q_table'] = None
+        rows.append({'row_type': 'trial', 'trial': trial + 1,
+                     'rung': state['rung'],
+                     'train_episodes': state['trained'], **state['params'],
+                     'win_rate': state['win_rate']})
 
     print("\n----- Best Hyperparameters Found -----")
     print(f"Learning Rate: {best_params['learning_rate']:.4f}")
@@ -120,13 +477,140 @@ def hyperparameter_tuning(grid_size,
     print(f"Exploration Rate: {best_params['exploration_rate']:.4f}")
     print(f"Winning Rate: {best_score:.4f}")
 
+    ensure_parent(bases.cfg['hyperparameter_tuning_results'])
     with open(bases.cfg['hyperparameter_tuning_results'],
               'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=['learning_rate',
+        writer = csv.DictWriter(f, fieldnames=['row_type', 'trial', 'rung',
+                                               'train_episodes',
+                                               'learning_rate',
                                                'discount_factor',
                                                'exploration_rate',
                                                'win_rate'])
         writer.writeheader()
-        writer.writerows(results)
+        writer.writerows(rows)
 
     return best_params
+
+
+def measure_throughput(grid_size: int, games: int) -> dict[str, float]:
+    """
+    Games per second of `Bases.play` (terminal output discarded) versus
+    headless `Bases.simulate`, both with a pair of `RandomAgent`s.
+    """
+    throughput = {}
+    game = Bases(grid_size)
+    players = (RandomAgent(), RandomAgent())
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            for _ in range(games):
+                game.play(*players)
+            throughput['play'] = games / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(games):
+        game.simulate(*players)
+    throughput['simulate'] = games / (time.perf_counter() - start)
+
+    print(f"play: {throughput['play']:.1f} games/s,",
+          f"simulate: {throughput['simulate']:.1f} games/s",
+          f"({throughput['simulate'] / throughput['play']:.1f}x)")
+    return throughput
+
+
+def measure_convergence(grid_size: int, target_win_rate: float = 0.6,
+                        trace_decays=(None, 0.8), max_episodes: int = 20000,
+                        eval_every: int = 500, test_episodes: int = 2000,
+                        learning_rate: float = 0.2,
+                        discount_factor: float = 1.0,
+                        exploration_rate: float = 0.2,
+                        seed: int | None = None) -> dict:
+    """
+    Episodes and training seconds a `QLearningAgent` needs to beat
+    `RandomAgent` at `target_win_rate`, for each `trace_decay` (None is
+    the one-step update after every move). Evaluation games are not
+    counted in the training time.
+    """
+    report = {}
+    for trace_decay in trace_decays:
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        agent = QLearningAgent(grid_size, learning_rate, discount_factor,
+                               exploration_rate, trace_decay=trace_decay)
+        opponent = RandomAgent()
+        game = Bases(grid_size)
+        episodes, seconds, win_rate = 0, 0.0, 0.0
+        while episodes < max_episodes and win_rate < target_win_rate:
+            agent.training_mode = True
+            start = time.perf_counter()
+            for _ in range(eval_every):
+                game.simulate(agent, opponent)
+            seconds += time.perf_counter() - start
+            episodes += eval_every
+            agent.training_mode = False
+            results = evaluate_batch(agent, opponent, grid_size,
+                                     test_episodes)
+            win_rate = results['A'] / test_episodes
+        reached = win_rate >= target_win_rate
+        report[trace_decay] = {'episodes': episodes, 'seconds': seconds,
+                               'win_rate': win_rate, 'reached': reached}
+        label = 'one-step' if trace_decay is None else \
+            f"lambda={trace_decay}"
+        print(f"{label}: {'reached' if reached else 'did not reach'}",
+              f"{target_win_rate:.0%} after {episodes} episodes",
+              f"({seconds:.1f}s training, win rate {win_rate:.1%})")
+    return report
+
+
+def _deep_sizeof(obj, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+                    for key, value in obj.items())
+    elif isinstance(obj, (tuple, list)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def measure_q_table_memory(grid_size: int, episodes: int,
+                           seed: int | None = None) -> dict[str, int]:
+    """
+    Train a `QLearningAgent` against `RandomAgent` for `episodes` games and
+    compare the memory of its integer-keyed Q-table with the former
+    {(state tuple, move): value} layout holding the same updated entries.
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    agent = QLearningAgent(grid_size, 0.5, 0.9, 0.1)
+    agent.visits = {}
+    game = Bases(grid_size)
+    for _ in range(episodes):
+        game.simulate(agent, RandomAgent())
+
+    legacy_table = {}
+    for state, edge in agent.visits:
+        lines, boxes = agent.decode_state(state)
+        legacy_state = (
+            tuple(sorted(tuple(sorted(line)) for line in lines)),
+            tuple(tuple(cell if cell is not None else ' ' for cell in row)
+                  for row in boxes)
+        )
+        legacy_table[(legacy_state, agent.tables.edges[edge])] = \
+            agent.get_q(state, edge)
+
+    report = {
+        'states': len(agent.q_table),
+        'entries': len(legacy_table),
+        'compact_bytes': _deep_sizeof(agent.q_table, set()),
+        'legacy_bytes': _deep_sizeof(legacy_table, set()),
+    }
+    print(f"{episodes} episodes on {grid_size}x{grid_size}:",
+          f"{report['states']} states, {report['entries']} entries;",
+          f"compact {report['compact_bytes'] / 2**20:.1f} MiB vs",
+          f"legacy {report['legacy_bytes'] / 2**20:.1f} MiB")
+    return report
@@ -1,21 +1,50 @@
-from bases import Bases, train_agents, hyperparameter_tuning
+import bases
+import os
 
 if __name__ == "__main__":
     size = int(input("Enter the size (greater than 2) of the grid: ")) - 1
     mode = input("Options: 'train', 'tune', or 'play': ").strip().lower()
 
+    # Imported after the prompts so they show up without delay
+    from bases.logs import configure_logging
+    configure_logging(mode if mode in ('train', 'tune') else 'play')
+
     if mode == 'train':
+        from bases import train_agents
+        from bases.instrument import Instrumentation
         episodes = int(input("Enter the no. of training episodes: "))
-        train_agents(size, episodes)
-        print("Training completed. Policy saved to 'policy.json'.")
+        workers = int(input("Enter the no. of worker processes [1]: ")
+                      or 1)
+        checkpoint_dir = bases.cfg.get('checkpoint_dir') or None
+        resume = False
+        if checkpoint_dir and os.path.exists(
+                os.path.join(checkpoint_dir, 'state.pkl')):
+            answer = input("Resume from the last checkpoint? [y/N]: ")
+            resume = answer.strip().lower() == 'y'
+        train_agents(size, episodes, workers=workers,
+                     instrumentation=Instrumentation.from_config(bases.cfg),
+                     checkpoint_dir=checkpoint_dir,
+                     checkpoint_every=bases.cfg.get('checkpoint_every',
+                                                    1000),
+                     resume=resume)
+        print("Training completed. Policy saved to",
+              f"'{bases.cfg['policy_path']}'.")
     elif mode == 'tune':
+        from bases import hyperparameter_tuning
+        from bases.instrument import Instrumentation
         iterations = int(input("Enter the no. of hyperparameter trials: "))
         train_episodes = int(input("Enter no. of train episodes per trial: "))
         test_episodes = int(input("Enter no. of eval episodes per trial: "))
+        workers = int(input("Enter the no. of worker processes [1]: ")
+                      or 1)
+        instrumentation = Instrumentation.from_config(bases.cfg)
         best_params = hyperparameter_tuning(size, iterations,
                                             train_episodes,
-                                            test_episodes)
+                                            test_episodes,
+                                            workers=workers,
+                                            instrumentation=instrumentation)
         print(f"Optimal hyperparameters: {best_params}")
     elif mode == 'play':
+        from bases import Bases
         game = Bases(size)
         game.game_loop()
@@ -0,0 +1,37 @@
+import pytest
+import bases
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    """Point bases.cfg at a bases.yml in `tmp_path`, a copy of the
+    package's with every file kept in `tmp_path`; returns a function that
+    rewrites it from keyword settings."""
+    import os
+    import yaml
+
+    path = tmp_path / 'bases.yml'
+    package_config = os.path.join(os.path.dirname(bases.__file__),
+                                  os.pardir, 'bases.yml')
+    with open(package_config) as f:
+        defaults = yaml.safe_load(f)
+
+    def write(**overrides):
+        values = {**defaults,
+                  'game_log': str(tmp_path / 'game.log'),
+                  'lines_log': str(tmp_path / 'lines.csv'),
+                  'hyperparameter_tuning_results': str(tmp_path / 'hp.csv'),
+                  'policy_path': str(tmp_path / 'policy.bin'),
+                  'checkpoint_dir': str(tmp_path / 'checkpoints'),
+                  'instrumentation': {'profile_dir':
+                                      str(tmp_path / 'profile')},
+                  'log_levels': {'play': 'WARNING', 'train': 'WARNING',
+                                 'tune': 'WARNING'}}
+        values.update(overrides)
+        path.write_text(yaml.safe_dump(values))
+        bases.cfg.load(path)
+
+    monkeypatch.setattr(bases.cfg, '_path', None)
+    monkeypatch.setattr(bases.cfg, '_settings', None)
+    write()
+    return write
@@ -0,0 +1,53 @@
+from array import array
+from bases.agent import QLearningAgent
+
+
+def _unvisited_rows(agent, count):
+    for state in range(count):
+        row = agent.new_row()
+        row[0] = state + 1
+        agent.q_table[state] = row
+
+
+def test_evict_with_more_unvisited_states_than_excess():
+    agent = QLearningAgent(2, max_states=10)
+    _unvisited_rows(agent, 50)
+    agent.set_q(1000, 0, 1.0)
+    assert len(agent.q_table) == 9
+    # Never-updated states go first, lowest keys first
+    assert sorted(agent.q_table) == list(range(42, 50)) + [1000]
+
+
+def test_evict_policies_keep_the_limit():
+    for eviction in ('lru', 'lfu', 'magnitude'):
+        agent = QLearningAgent(2, max_states=10, eviction=eviction)
+        _unvisited_rows(agent, 50)
+        for state in range(1000, 1020):
+            agent.set_q(state, 0, 2.0)
+        assert len(agent.q_table) <= 10
+        assert set(agent.state_visits) <= set(agent.q_table)
+
+
+def test_prune_and_evict_a_mapped_policy(tmp_path):
+    agent = QLearningAgent(2)
+    _unvisited_rows(agent, 20)
+    agent.q_table[100] = array('f', bytes(4 * agent.tables.num_edges))
+    path = tmp_path / 'policy.bin'
+    agent.save_policy(path)
+
+    loaded = QLearningAgent(2, max_states=10)
+    loaded.load_policy(path)
+    assert loaded.prune() == 1
+    assert loaded.evict() == 11
+    assert len(loaded.q_table) == 9
+
+
+def test_state_stored_into_a_full_table_is_kept():
+    for eviction in ('lru', 'lfu', 'magnitude'):
+        agent = QLearningAgent(2, max_states=10, eviction=eviction)
+        for state in range(10):
+            for _ in range(3):
+                agent.set_q(state, 0, 2.0)
+        agent.set_q(1000, 0, 0.001)
+        assert 1000 in agent.q_table
+        assert len(agent.q_table) == 9
@@ -0,0 +1,83 @@
+from bases.agent import QLearningAgent
+from bases.checkpoint import Checkpointer
+from bases.train import train_agents
+
+
+def _checkpoint(directory, grid_size, max_states=None):
+    """Agents restored from the checkpoint in `directory`."""
+    agents = [QLearningAgent(grid_size, max_states=max_states)
+              for _ in range(2)]
+    state = Checkpointer(directory, agents).restore()
+    tables = [{key: list(values) for key, values in agent.q_table.items()}
+              for agent in agents]
+    return state, tables, [agent.state_visits for agent in agents]
+
+
+def test_resumed_bounded_run_matches_uninterrupted(tmp_path, settings):
+    settings(max_states=40, eviction='lfu')
+    whole, split = tmp_path / 'whole', tmp_path / 'split'
+    train_agents(2, 300, seed=3, checkpoint_dir=whole, checkpoint_every=50)
+    train_agents(2, 150, seed=3, checkpoint_dir=split, checkpoint_every=50)
+    train_agents(2, 300, seed=3, checkpoint_dir=split, checkpoint_every=50,
+                 resume=True)
+
+    expected = _checkpoint(whole, 2, 40)
+    resumed = _checkpoint(split, 2, 40)
+    assert expected[0]['wins'] == resumed[0]['wins']
+    assert expected[1] == resumed[1]
+    assert expected[2] == resumed[2]
+    assert all(len(table) <= 40 for table in resumed[1])
+
+
+def test_compact_drops_deleted_states(tmp_path):
+    from array import array
+    from bases.checkpoint import TrackedQTable, append_segment, compact
+    from bases.policy import MappedQTable
+
+    agent = QLearningAgent(2)
+    num_edges = agent.tables.num_edges
+    table = TrackedQTable()
+    for state in range(10):
+        table[state] = array('f', [state] * num_edges)
+    base, delta = tmp_path / 'a.bin', tmp_path / 'a.delta'
+    append_segment(delta, table, table.dirty, 2, 1)
+    compact(base, delta, 2, num_edges, 0.1, 0.9, 0.1)
+
+    table.dirty, table.deleted = set(), set()
+    del table[3]
+    table.pop(7)
+    table[12] = array('f', [12] * num_edges)
+    append_segment(delta, table, table.dirty, 2, 2, table.deleted)
+    compact(base, delta, 2, num_edges, 0.1, 0.9, 0.1)
+
+    merged = MappedQTable(base)
+    assert sorted(merged) == sorted(table)
+    assert all(list(merged[state]) == list(table[state]) for state in table)
+    merged.close()
+
+
+def test_crash_then_resume_twice(tmp_path, settings):
+    from array import array
+    from bases.checkpoint import append_segment, compact
+    from bases.policy import MappedQTable
+
+    whole, split = tmp_path / 'whole', tmp_path / 'split'
+    train_agents(2, 300, seed=5, checkpoint_dir=whole, checkpoint_every=50)
+    train_agents(2, 150, seed=5, checkpoint_dir=split, checkpoint_every=50)
+    # A crash after appending the episode 200 rows, before state.pkl
+    num_edges = QLearningAgent(2).tables.num_edges
+    stale = {1 << 20: array('f', [99.0] * num_edges)}
+    append_segment(split / 'a.delta', stale, stale, 2, 200)
+    train_agents(2, 250, seed=5, checkpoint_dir=split, checkpoint_every=50,
+                 resume=True)
+    train_agents(2, 300, seed=5, checkpoint_dir=split, checkpoint_every=50,
+                 resume=True)
+
+    expected, resumed = _checkpoint(whole, 2), _checkpoint(split, 2)
+    assert expected[1] == resumed[1]
+
+    compact(split / 'a.bin', split / 'a.delta', 2, num_edges, 0.1, 0.9, 0.1)
+    merged = MappedQTable(split / 'a.bin')
+    assert {key: list(values) for key, values in merged.items()} == \
+        expected[1][0]
+    merged.close()
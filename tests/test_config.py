@@ -0,0 +1,12 @@
+import os
+
+import bases
+
+
+def test_relative_paths_follow_config_file(settings, tmp_path, monkeypatch):
+    settings(policy_path='policy/q.bin',
+             instrumentation={'profile_dir': 'profile'})
+    monkeypatch.chdir(os.path.dirname(bases.__file__))
+    assert bases.cfg['policy_path'] == str(tmp_path / 'policy' / 'q.bin')
+    assert bases.cfg['instrumentation']['profile_dir'] == \
+        str(tmp_path / 'profile')
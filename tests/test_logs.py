@@ -0,0 +1,13 @@
+from bases.board import board_tables
+from bases.logs import MoveLogWriter, read_move_log
+
+
+def test_binary_log_round_trips_large_boards(tmp_path):
+    for size in (3, 11):
+        path = tmp_path / f'moves{size}.bin'
+        edges = list(reversed(board_tables(size).edges))
+        writer = MoveLogWriter(path, 'binary', buffer_games=1)
+        writer.write_game([{'game_id': 1, 'x1': x1, 'y1': y1, 'x2': x2,
+                            'y2': y2} for x1, y1, x2, y2 in edges], size)
+        assert [(row['x1'], row['y1'], row['x2'], row['y2'])
+                for row in read_move_log(path)] == edges
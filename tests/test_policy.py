@@ -0,0 +1,81 @@
+import json
+import random
+from bases.agent import QLearningAgent
+from bases.game import Bases
+from bases.policy import convert_policy
+
+
+def _legacy_state(agent, game):
+    """Canonical state of the old JSON policies: the smallest transform
+    with each line's coordinates sorted."""
+    lines, boxes = game.get_detailed_state()
+    states = []
+    for trans_lines, trans_boxes in \
+            agent.generate_rotations_and_reflections(lines, boxes):
+        states.append((
+            tuple(sorted(tuple(sorted(line)) for line in trans_lines)),
+            tuple(tuple(' ' if cell is None else cell for cell in row)
+                  for row in trans_boxes)))
+    return min(states)
+
+
+def _convert(tmp_path, entries, grid_size):
+    json_path, out_path = tmp_path / 'policy.json', tmp_path / 'policy.bin'
+    json_path.write_text(json.dumps({str(key): value
+                                     for key, value in entries.items()}))
+    report = convert_policy(json_path, out_path, grid_size)
+    agent = QLearningAgent(grid_size, training_mode=False)
+    agent.load_policy(out_path)
+    return report, agent
+
+
+def test_ambiguous_legacy_lines_are_skipped(settings, tmp_path):
+    agent = QLearningAgent(2)
+    game = Bases(2)
+    game.make_move(0, 0, 1, 0)
+    state = _legacy_state(agent, game)
+    # Horizontal (0, 0, 1, 0) sorts like vertical (0, 0, 0, 1)
+    assert state[0] == ((0, 0, 0, 1),)
+    report, _ = _convert(tmp_path, {(state, (1, 0, 2, 0)): 0.5}, 2)
+    assert report == {'converted': 0, 'skipped': 1}
+
+
+def test_legacy_policy_round_trip(settings, tmp_path):
+    grid_size = 3
+    agent = QLearningAgent(grid_size)
+    tables = agent.tables
+    rng = random.Random(7)
+    entries, cases = {}, []
+    for _ in range(200):
+        game = Bases(grid_size)
+        # Lines paired with their mirror image across the main diagonal
+        for edge in rng.sample(range(tables.num_horizontal), 2):
+            x1, y1, x2, y2 = tables.edges[edge]
+            for line in ((x1, y1, x2, y2), (y1, x1, y2, x2)):
+                if not game.is_line_drawn(*line):
+                    game.make_move(*line)
+        state = _legacy_state(agent, game)
+        if any(key[0] == state for key in entries):
+            continue
+        move = rng.choice(game.available_moves())
+        value = round(rng.uniform(-1, 1), 3)
+        entries[(state, move)] = value
+        cases.append((game.get_state_key(), move, value))
+
+    report, converted = _convert(tmp_path, entries, grid_size)
+    assert report['converted'] > 0
+    assert report['converted'] + report['skipped'] == len(entries)
+    reproduced = 0
+    for key, move, value in cases:
+        # The old lookup gave `value` for this board move on every
+        # symmetric image of the board
+        boards = {agent.symmetry.permute(key, sym) for sym in range(8)}
+        rows = [converted.canonical_state(board) for board in boards]
+        values = [converted.q_table.get(state) for state, _ in rows]
+        if values[0] is None:
+            continue
+        edge = tables.edge_index[move]
+        assert all(abs(row[perm[edge]] - value) < 1e-6
+                   for row, (_, perm) in zip(values, rows))
+        reproduced += 1
+    assert reproduced == report['converted']
@@ -0,0 +1,11 @@
+from bases.board import board_tables
+from bases.search import SearchAgent
+
+
+def test_node_budget_without_time_limit():
+    for node_limit in (10, 500, 5000):
+        agent = SearchAgent(time_limit=None, node_limit=node_limit)
+        agent.tables = board_tables(3)
+        edge, _, _ = agent.search(0, 0)
+        assert edge is not None
+        assert agent.nodes == node_limit
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+import pytest
+from bases.agent import QLearningAgent
+from bases.game import Bases
+from bases.serve import PolicyServer, RemoteAgent
+
+
+def test_failed_batch_is_answered_and_server_keeps_going(settings,
+                                                         tmp_path):
+    policy = tmp_path / 'policy.bin'
+    QLearningAgent(2).save_policy(policy)
+    server = PolicyServer(policy, 2)
+    best_edges = server.best_edges
+    calls = []
+
+    def failing_once(keys):
+        calls.append(keys)
+        if len(calls) == 1:
+            raise ValueError("lookup failed")
+        return best_edges(keys)
+    server.best_edges = failing_once
+
+    address = f"unix:{tmp_path / 'bases.sock'}"
+    ready = threading.Event()
+    threading.Thread(target=asyncio.run, args=(server.serve(address, ready),),
+                     daemon=True).start()
+    assert ready.wait(5)
+    agent, game = RemoteAgent(address, timeout=5), Bases(2)
+    with pytest.raises(RuntimeError, match='edge -1'):
+        agent.choose_action(game)
+    assert agent.choose_action(game) in game.available_moves()
+    agent.close()
+    assert server.stats['errors'] == 1
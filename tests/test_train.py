@@ -0,0 +1,15 @@
+import csv
+
+from bases.train import hyperparameter_tuning
+
+
+def test_tuning_trains_best_trial_for_full_budget(settings, tmp_path):
+    results = tmp_path / 'tuning.csv'
+    settings(hyperparameter_tuning_results=str(results))
+    best = hyperparameter_tuning(2, 2, 90, 10, seed=0)
+    with open(results, newline='') as f:
+        trials = [row for row in csv.DictReader(f)
+                  if row['row_type'] == 'trial']
+    winner, = [row for row in trials
+               if float(row['learning_rate']) == best['learning_rate']]
+    assert int(winner['train_episodes']) == 90